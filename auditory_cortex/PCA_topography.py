@@ -4,17 +4,20 @@ import pickle
 import numpy as np
 import pandas as pd
 import scipy as scp
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-from matplotlib.lines import Line2D
-from sklearn.decomposition import PCA
 
 
 #local 
 from auditory_cortex.models import Regression
 from auditory_cortex.analysis import Correlations
 import auditory_cortex.utils as utils
-from auditory_cortex import results_dir, CMAP_2D
+from auditory_cortex import results_dir, lazy_import
+
+# imported on first use...
+sns = lazy_import('seaborn')
+mpl = lazy_import('matplotlib')
+plt = lazy_import('matplotlib.pyplot')
+mlines = lazy_import('matplotlib.lines')
+decomposition = lazy_import('sklearn.decomposition')
 
 #PCA_kde_data
 pca_kde_sub_dir = 'PCA_kde_data'
@@ -89,7 +92,7 @@ class PCATopography:
             self.features = self.reg_obj.unroll_features(return_dict=True)
         # if layer_idx not in self.features.keys():
             
-        pca = PCA(n_components=n_components, svd_solver=svd_solver)
+        pca = decomposition.PCA(n_components=n_components, svd_solver=svd_solver)
         if layer_idx not in self.pcs.keys():
             self.pcs[layer_idx] = np.transpose(pca.fit_transform(self.features[layer_idx]))
             self.pca[layer_idx] = pca
@@ -416,7 +419,7 @@ class PCATopography:
                                   normalized=normalized, color=cmap(i/N), ax=ax)
             cc = self.get_corr_score(session, layer, ch)
             if i%legend_spacing==0:
-                legend_elements.append(Line2D([0], [0], color=cmap(i/N), lw=4, 
+                legend_elements.append(mlines.Line2D([0], [0], color=cmap(i/N), lw=4, 
                     label=f'ch-{ch}, \u0393-{cc:.2f}'))
         # # extracting axis limits..
         # for coll in ax.collections:
@@ -485,7 +488,7 @@ class PCATopography:
                 # cs = self.plot_kde(session, layer, ch, ax=ax, levels=levels, color=c_map, comps=comps)#cmap(counter/N))
                 cs = self.plot_kde_2d(session, layer, ch, comps=comps, levels=levels,
                                   normalized=normalized, color=c_map, ax=ax, threshold_factor=threshold_factor)
-                legend_elements.append(Line2D([0], [0], lw=4, color=c_map, 
+                legend_elements.append(mlines.Line2D([0], [0], lw=4, color=c_map, 
                                     label=f"{int(session):6d},ch{int(ch):2d}, \u0393-{cc:.2f}"))
             counter += 1
 
@@ -535,7 +538,7 @@ class PCATopography:
             comps = [0,1]    
         # # Finding pc space 
         features = self.get_features(layer)
-        pca = PCA(n_components=10)
+        pca = decomposition.PCA(n_components=10)
         pc_10 = pca.fit_transform(features).transpose()
 
         # pc_ind = [0,2]
@@ -575,12 +578,12 @@ class PCATopography:
             plt.axvline(x=e*2, color=color1)
             plt.axvline(x=(e+1)*2, color=color1)
             # fig.add_vrect(x0=e*2, x1=(e+1)*2, fillcolor=color1, opacity=0.2)
-        handles.append(Line2D([0],[0], label='cluster-1', color=color1))
+        handles.append(mlines.Line2D([0],[0], label='cluster-1', color=color1))
         for e in r:
             plt.axvline(x=e*2, color=color2)
             plt.axvline(x=(e+1)*2, color=color2)
             # fig.add_vrect(x0=e*2, x1=(e+1)*2, fillcolor=color2, opacity=0.2)
-        handles.append(Line2D([0],[0], label='cluster-2', color=color2))
+        handles.append(mlines.Line2D([0],[0], label='cluster-2', color=color2))
         plt.title(f"l-{layer}, pc{comps}, sent-{sent}")
         plt.legend(handles=handles)
         return ax
@@ -649,6 +652,7 @@ class PCATopography:
         x_max = 2
         y_min = -2
         y_max = 2
+        from auditory_cortex import CMAP_2D
         cmap_2d = CMAP_2D(range_x=(x_min, x_max), range_y=(y_min, y_max))
         x_coordinates = np.linspace(x_min, x_max, n)
         y_coordinates = np.linspace(y_min, y_max, n)
@@ -4,6 +4,7 @@ from scipy.signal import resample
 
 import naplib as nl
 from auditory_cortex import dataset, config
+from auditory_cortex.frontend_cache import get_frontend_cache
 from sklearn.linear_model import Ridge, ElasticNet
 
 
@@ -18,6 +19,8 @@ class STRF:
         self.dataset = dataset.NeuralData(data_dir, session)
         self.dataset.extract_spikes(bin_width=self.bin_width, delay=0)
         self.fs = self.dataset.fs
+        # auditory spectrograms, computed once per sentence (see 'frontend_cache')
+        self.frontend = get_frontend_cache('auditory_spectrogram', {'fs': float(self.fs)})
 
 
 
@@ -29,7 +32,7 @@ class STRF:
         spikes = self.dataset.unroll_spikes([sent], third=third).astype(np.float32)
 
         aud = self.dataset.audio(sent)
-        spect = nl.features.auditory_spectrogram(aud, self.fs)
+        spect = self.frontend.get(aud, lambda aud: nl.features.auditory_spectrogram(aud, self.fs))
 
         if third is not None:
             bin_width = self.bin_width/1000.0
@@ -1,12 +1,35 @@
 # standard libraries
 import os
+import sys
 import yaml
+import importlib
 import numpy as np
-from pycolormap_2d import ColorMap2DBremm, ColorMap2DZiegler
+from types import ModuleType
 
 
+class LazyModule(ModuleType):
+    """Stand-in for a module that is imported on first attribute access."""
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self.__name__), attr)
+
+def lazy_import(name):
+    """Returns module 'name' (if already imported) or a stand-in that imports it 
+    on first use, keeps heavy dependencies (plotting, torch etc.) out of 
+    the import time of jobs that never use them."""
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
+# 2d color maps (from pycolormap_2d) are resolved on first use, 
 # select 2d color map to be used
-CMAP_2D = ColorMap2DZiegler
+CMAP_2D_NAME = 'ColorMap2DZiegler'
+
+def __getattr__(name):
+    if name == 'CMAP_2D':
+        name = CMAP_2D_NAME
+    if name in ('ColorMap2DBremm', 'ColorMap2DZiegler'):
+        return getattr(importlib.import_module('pycolormap_2d'), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # get parent directory of directory containing __init__.py file (parent of parent)
 aux_dir = os.path.join(os.path.dirname(__file__), 'auxilliary')
@@ -23,6 +46,8 @@ results_dir = config['results_dir']
 saved_corr_dir = os.path.join(results_dir, 'cross_validated_correlations')
 pretrained_dir = os.path.join(results_dir, 'pretrained_weights')
 opt_inputs_dir = os.path.join(results_dir, 'optimal_inputs')
+# on-disk caches (stimulus bank, normalizers, features etc.)
+cache_dir = os.path.join(results_dir, 'cache')
 
 
 
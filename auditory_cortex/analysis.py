@@ -3,24 +3,23 @@ import pickle
 import numpy as np
 import pandas as pd
 import scipy as scp
-import seaborn as sns
-import matplotlib as mpl
-import plotly.express as px
 from scipy.io import wavfile
-import matplotlib.pyplot as plt
-from matplotlib.lines import Line2D
-from sklearn.decomposition import PCA
-
-from palettable.colorbrewer import qualitative
 
 
 #local 
-from auditory_cortex.models import Regression
-from auditory_cortex.optimal_input import OptimalInput
 import auditory_cortex.utils as utils
 from auditory_cortex.utils import SyntheticInputUtils
-from auditory_cortex import session_to_coordinates, CMAP_2D, session_to_subject, session_to_area
-from auditory_cortex import saved_corr_dir, opt_inputs_dir
+from auditory_cortex import session_to_coordinates, session_to_subject, session_to_area
+from auditory_cortex import saved_corr_dir, opt_inputs_dir, lazy_import
+
+# plotting libraries (and networks, for 'SyntheticInputs') are imported on first use...
+sns = lazy_import('seaborn')
+mpl = lazy_import('matplotlib')
+px = lazy_import('plotly.express')
+plt = lazy_import('matplotlib.pyplot')
+mlines = lazy_import('matplotlib.lines')
+qualitative = lazy_import('palettable.colorbrewer.qualitative')
+optimal_input = lazy_import('auditory_cortex.optimal_input')
 # from pycolormap_2d import ColorMap2DBremm, config, results_dir
 
 
@@ -41,7 +40,7 @@ class SyntheticInputs:
         # self.colors = qualitative.Set2_8.mpl_colors
         self.colors = qualitative.Dark2_8.mpl_colors
         
-        self.opt_objs[model_name] = OptimalInput(
+        self.opt_objs[model_name] = optimal_input.OptimalInput(
             model_name, 
             load_features=load_features
         )
@@ -57,7 +56,7 @@ class SyntheticInputs:
         if model_name is None:
             model_name = self.model_name
         if model_name not in self.opt_objs.keys():
-            self.opt_objs[model_name] = OptimalInput(
+            self.opt_objs[model_name] = optimal_input.OptimalInput(
                 model_name, load_features=False
             )
         return self.opt_objs[model_name]
@@ -80,7 +79,7 @@ class SyntheticInputs:
             betas = np.load(file_path)
         else:
             print("Computing betas...")
-            self.opt_objs[model_name] = OptimalInput(
+            self.opt_objs[model_name] = optimal_input.OptimalInput(
                 model_name, load_features=True
             )
             betas = (self.get_opt_obj(model_name).get_betas(session)).cpu().numpy()
@@ -316,17 +315,17 @@ class SyntheticInputs:
         # plotting session1
         self.plot_corr_vs_betas(session1, layer, st_sent, ax=ax, color=self.colors[0],
                                 model_name=model_name)
-        legend_elements.append(Line2D([0], [0], color=self.colors[0], label=f'{str(session1)}'))
+        legend_elements.append(mlines.Line2D([0], [0], color=self.colors[0], label=f'{str(session1)}'))
         # plotting session1
         self.plot_corr_vs_betas(session2, layer, st_sent, ax=ax, color=self.colors[1],
                                 model_name=model_name)
-        legend_elements.append(Line2D([0], [0], color=self.colors[1], label=f'{str(session2)}'))
+        legend_elements.append(mlines.Line2D([0], [0], color=self.colors[1], label=f'{str(session2)}'))
         
         # computing across sessions
         df = self.analyze_synthetic_inputs_across_sessions(
             session1, session2, layer, st_sent, model_name=None
         )
-        legend_elements.append(Line2D([0], [0], color=self.colors[2], label=f'{str(session1)}-{str(session2)}'))
+        legend_elements.append(mlines.Line2D([0], [0], color=self.colors[2], label=f'{str(session1)}-{str(session2)}'))
         # plotting across sessions..
         ax = df.plot.scatter(x='corr_betas', y='corr_opt_inputs', ax=ax, color=self.colors[2])
         ax.set_title(f"{model_name}, \n sessions-{session1} & {session2}, L-{layer}, starting-{st_sent}")
@@ -380,15 +379,15 @@ class SyntheticInputs:
         # plotting session1
         self.plot_corr_vs_betas(session, layer1, st_sent, ax=ax, color=self.colors[0],
                                 model_name=model_name1)
-        legend_elements.append(Line2D([0], [0], color=self.colors[0], label=f'{model_name1}'))
+        legend_elements.append(mlines.Line2D([0], [0], color=self.colors[0], label=f'{model_name1}'))
         # plotting session1
         self.plot_corr_vs_betas(session, layer2, st_sent, ax=ax, color=self.colors[1],
                                 model_name=model_name2)
-        legend_elements.append(Line2D([0], [0], color=self.colors[1], label=f'{model_name2}'))
+        legend_elements.append(mlines.Line2D([0], [0], color=self.colors[1], label=f'{model_name2}'))
         
         df = self.analyze_synthetic_inputs_across_models(
             model_name1, model_name2, session, layer1, layer2, st_sent)
-        legend_elements.append(Line2D([0], [0], color=self.colors[2], label=f'{model_name1}-{model_name1}'))
+        legend_elements.append(mlines.Line2D([0], [0], color=self.colors[2], label=f'{model_name1}-{model_name1}'))
         ax = df.plot.scatter(x='corr_betas', y='cross_corr_opt_inputs', ax=ax, color=self.colors[2])
         ax.set_title(f"{model_name1}, L-{layer1} & {model_name2}, L-{layer2} \n session-{session}, starting-{st_sent}")
         plt.legend(legend_elements)
@@ -937,7 +936,8 @@ class Correlations:
     def plot_coordinate_color_map(self, dot_size=400, fontsize=12):
         # fontsize = 12
         # dot_size = 400
-        cmap_2d = ColorMap2DZiegler(range_x=(-2, 2), range_y=(-2,2))
+        from auditory_cortex import CMAP_2D
+        cmap_2d = CMAP_2D(range_x=(-2, 2), range_y=(-2,2))
         sessions = self.get_significant_sessions()
         coordinates = []
         colors = []
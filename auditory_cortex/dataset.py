@@ -2,9 +2,489 @@ from scipy import io
 import numpy as np
 import json
 import os
-import matplotlib.pyplot as plt
+import shutil
+import hashlib
+import uuid
+from types import SimpleNamespace
+from collections.abc import Mapping
 
 import auditory_cortex.utils as utils
+from auditory_cortex import cache_dir, lazy_import
+
+# imported on first use (plotting only)...
+plt = lazy_import('matplotlib.pyplot')
+
+# sub-directory (inside session directory) holding the compiled spike store
+COMPILED_DIR = 'compiled_spikes'
+COMPILED_LAYOUT = 'layout.json'
+# fields of 'spike' struct kept in the compiled store
+SPIKE_FIELDS = ['trial', 'stimlock', 'spktimes']
+# stimulus details file (shared by all sessions)
+STIMULUS_MAT_FILE = 'out_sentence_details_timit_all_loudness.mat'
+# timitStimcodes with repeated trials (used for normalizers)
+REPEATED_SENTS = [12,13,32,43,56,163,212,218,287,308]
+# sub-directory (inside cache_dir) holding normalizer distributions
+NORMALIZER_CACHE = 'normalizers'
+# stimulus banks loaded in this process, one per stimulus file
+_stimulus_banks = {}
+
+
+def index_trials(trial, channel_offsets, num_trials):
+  """Returns CSR offsets of spikes sorted by (channel, trial), spikes of
+  channel 'ch' and trial 'tr' are at [offsets[ch, tr]:offsets[ch, tr+1]].
+
+  Args:
+    trial (ndarray): (num_spikes,) trial ID of spikes, sorted within each channel.
+    channel_offsets (ndarray): (num_channels + 1,) start/stop of channels.
+    num_trials (int): number of trials (trial ID's are in range [1, num_trials]).
+
+  Returns:
+    ndarray: (num_channels, num_trials + 2) offsets.
+  """
+  num_channels = channel_offsets.size - 1
+  offsets = np.zeros((num_channels, num_trials + 2), dtype=np.int64)
+  for i in range(num_channels):
+    start, stop = channel_offsets[i], channel_offsets[i+1]
+    offsets[i] = start + np.searchsorted(trial[start:stop], np.arange(num_trials + 2), side='left')
+  return offsets
+
+
+def source_fingerprint(dir, sub):
+  """Returns {filename: [size, mtime_ns]} for __MUspk.mat files of a session,
+  used to tell if a compiled store is stale."""
+  path = os.path.join(dir, sub)
+  names = sorted(name for name in os.listdir(path) if 'MUspk' in name)
+  fingerprint = {}
+  for name in names:
+    stat = os.stat(os.path.join(path, name))
+    fingerprint[name] = [stat.st_size, stat.st_mtime_ns]
+  return fingerprint
+
+
+def unique_path(path, suffix='.tmp'):
+  """Returns 'path' with a process and call unique suffix, (temporary paths 
+  of concurrent writers never collide)."""
+  return f'{path}.{os.getpid()}.{uuid.uuid4().hex[:12]}{suffix}'
+
+
+def publish_dir(tmp_dir, out_dir, is_valid):
+  """Atomically renames freshly written 'tmp_dir' to 'out_dir' (safe with
+  concurrent writers of the same cache). If 'out_dir' already exists and 
+  'is_valid(out_dir)', it is kept and 'tmp_dir' is discarded, a stale 'out_dir' 
+  is first renamed aside (processes that memory-mapped it keep their pages).
+
+  Returns:
+    str: out_dir
+  """
+  while True:
+    try:
+      os.rename(tmp_dir, out_dir)
+      return out_dir
+    except OSError:
+      if not os.path.exists(out_dir):
+        raise
+    if is_valid(out_dir):
+      # published by another process in the meantime...
+      shutil.rmtree(tmp_dir, ignore_errors=True)
+      return out_dir
+    stale_dir = unique_path(out_dir, '.stale')
+    try:
+      os.rename(out_dir, stale_dir)
+    except FileNotFoundError:
+      continue
+    shutil.rmtree(stale_dir, ignore_errors=True)
+
+
+def compiled_store_valid(out_dir, fingerprint):
+  """Returns True if compiled store at 'out_dir' is complete and matches 
+  'fingerprint' of the source files (see 'source_fingerprint')."""
+  try:
+    with open(os.path.join(out_dir, COMPILED_LAYOUT), 'r') as f:
+      return json.load(f)['fingerprint'] == fingerprint
+  except (OSError, ValueError, KeyError):
+    return False
+
+
+def compile_session(dir, sub, verbose=False):
+  """Compiles __MUspk.mat files of session 'sub' into a flat binary layout,
+  that is memory-mapped by NeuralData (instead of parsing .mat files).
+
+  Spikes of all channels are concatenated (channel by channel) and sorted 
+  by (trial, stimlock) within each channel. Layout written to 'dir/sub/compiled_spikes':
+    trial.npy, stimlock.npy, spktimes.npy:  per-spike arrays (all channels)
+    channel_offsets.npy:  (num_channels + 1,) start/stop of channels in per-spike arrays
+    trial_offsets.npy:    (num_channels, num_trials + 2) CSR index (see 'index_trials')
+    trial_<field>.npy:    per-trial metadata (from 'trial' struct of first channel)
+    layout.json:          channel names, fields and fingerprint of source files.
+
+  The store is written to a unique temporary directory and renamed in place 
+  (see 'publish_dir'), so concurrent jobs compiling the same session do not
+  interfere and an up-to-date store is never removed.
+
+  Args:
+    dir (str): neural data directory
+    sub (str): session ID
+
+  Returns:
+    str: path of the compiled store.
+  """
+  sub = str(sub)
+  path = os.path.join(dir, sub)
+  fingerprint = source_fingerprint(dir, sub)
+  names = list(fingerprint.keys())
+
+  fields = {field: [] for field in SPIKE_FIELDS}
+  offsets = [0]
+  trial_fields = {}
+  for i, name in enumerate(names):
+    if verbose:
+      print(name)
+    data = io.loadmat(os.path.join(path, name), squeeze_me = True, struct_as_record = False)
+    spike = data['spike']
+    values = {field: np.atleast_1d(getattr(spike, field)) for field in SPIKE_FIELDS}
+    order = np.lexsort((values['stimlock'], values['trial']))
+    for field in SPIKE_FIELDS:
+      fields[field].append(values[field][order])
+    offsets.append(offsets[-1] + order.size)
+    if i == 0:
+      # trial structs are the same for all channels, keeping the first one.
+      for field in data['trial']._fieldnames:
+        value = np.atleast_1d(getattr(data['trial'], field))
+        if value.ndim == 1 and value.dtype.kind in 'biuf':
+          trial_fields[field] = value
+
+  out_dir = os.path.join(path, COMPILED_DIR)
+  tmp_dir = unique_path(out_dir)
+  os.makedirs(tmp_dir)
+  try:
+    write_compiled(tmp_dir, fields, offsets, trial_fields, names, fingerprint)
+  except BaseException:
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    raise
+  return publish_dir(tmp_dir, out_dir, lambda out_dir: compiled_store_valid(out_dir, fingerprint))
+
+
+def write_compiled(tmp_dir, fields, offsets, trial_fields, names, fingerprint):
+  """Writes arrays and layout of the compiled store to 'tmp_dir' (see 'compile_session')."""
+  np.save(os.path.join(tmp_dir, 'trial.npy'), np.concatenate(fields['trial']).astype(np.int32))
+  np.save(os.path.join(tmp_dir, 'stimlock.npy'), np.concatenate(fields['stimlock']).astype(np.float64))
+  np.save(os.path.join(tmp_dir, 'spktimes.npy'), np.concatenate(fields['spktimes']).astype(np.float64))
+  np.save(os.path.join(tmp_dir, 'channel_offsets.npy'), np.array(offsets, dtype=np.int64))
+  np.save(
+    os.path.join(tmp_dir, 'trial_offsets.npy'),
+    index_trials(
+      np.concatenate(fields['trial']), np.array(offsets, dtype=np.int64), 
+      trial_fields['timitStimcode'].size
+    )
+  )
+  for field, value in trial_fields.items():
+    np.save(os.path.join(tmp_dir, f'trial_{field}.npy'), value)
+  layout = {
+    'channels': names,
+    'spike_fields': SPIKE_FIELDS,
+    'trial_fields': list(trial_fields.keys()),
+    'fingerprint': fingerprint,
+  }
+  with open(os.path.join(tmp_dir, COMPILED_LAYOUT), 'w') as f:
+    json.dump(layout, f)
+
+
+def normalizer_cache_file(dir, sub, sents=None, bin_width=20, delay=0, n=1000, mat_file=STIMULUS_MAT_FILE):
+  """Returns path of the cached normalizer for given parameters, file name is a 
+  content hash of the parameters and fingerprints of the session spike files 
+  (see 'source_fingerprint') and stimulus file, so changes to these files 
+  invalidate the cached normalizers."""
+  if sents is None:
+    sents = REPEATED_SENTS
+  stat = os.stat(os.path.join(dir, mat_file))
+  key = json.dumps({
+    'session': str(sub),
+    'sents': [int(s) for s in sents],
+    'bin_width': float(bin_width),
+    'delay': float(delay),
+    'n': n,
+    'source': source_fingerprint(dir, str(sub)),
+    'stimulus': [mat_file, stat.st_size, stat.st_mtime_ns],
+    }, sort_keys=True)
+  name = hashlib.sha1(key.encode()).hexdigest()[:20]
+  return os.path.join(cache_dir, NORMALIZER_CACHE, str(sub), f'{name}.npz')
+
+def load_normalizer(dir, sub, sents=None, bin_width=20, delay=0, n=1000, mat_file=STIMULUS_MAT_FILE):
+  """Returns (distribution, median) of normalizer cached for given parameters, 
+  None if not in the cache."""
+  path = normalizer_cache_file(dir, sub, sents, bin_width, delay, n, mat_file)
+  if not os.path.isfile(path):
+    return None
+  with np.load(path) as f:
+    return f['distribution'], f['median']
+
+def save_normalizer(dir, sub, distribution, median, sents=None, bin_width=20, delay=0, n=1000, mat_file=STIMULUS_MAT_FILE):
+  """Writes normalizer (distribution, median) to the cache (see 'load_normalizer'),
+  returns path of the cached file, None if cache can not be written."""
+  path = normalizer_cache_file(dir, sub, sents, bin_width, delay, n, mat_file)
+  tmp_path = f'{path}.{os.getpid()}.tmp'
+  try:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(tmp_path, 'wb') as f:
+      np.savez(f, distribution=distribution, median=median)
+    os.replace(tmp_path, path)
+  except OSError as err:
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
+    print(f"(normalizer not cached: {err}) ", end='')
+    return None
+  return path
+
+
+def num_bins(duration, win):
+  """Returns number of 'win' (sec) bins for 'duration' (sec)."""
+  # round the 3rd decimal digit, before ceiling...!
+  return int(np.ceil(round(duration/win, 3)))
+
+
+def accumulated_edges(win, delay, n):
+  """Returns (n+1,) bin edges starting at 'delay', accumulated by repeated 
+  addition of 'win' (exactly as the edges of the original binning loop),
+  so that spikes falling on the edges land in the same bins."""
+  return np.cumsum(np.concatenate([[delay], np.full(n, win)]))
+
+
+def count_spikes(times, channels, positions, num_bins, num_channels, win, delay):
+  """Vectorized binning of spikes for a batch of trials (all channels at once).
+  Bins are right-closed i.e. (delay + j*win, delay + (j+1)*win], spikes at or 
+  before 'delay' and after the last bin of the trial are dropped.
+
+  Args:
+    times (ndarray): (num_spikes,) spike times (sec) relative to stimulus onset.
+    channels (ndarray): (num_spikes,) channel index of each spike.
+    positions (ndarray): (num_spikes,) position (in batch) of trial of each spike.
+    num_bins (ndarray): (num_trials,) number of bins for each trial in the batch.
+    num_channels (int): number of channels.
+    win (float): width of bins (sec).
+    delay (float or list): start of the first bin (sec), a list of delays
+        bins the same spikes for every delay (in one call).
+
+  Returns:
+    counts (ndarray): (sum(num_bins), num_channels) ragged array of int32 counts, 
+        bins of i-th trial are counts[bin_offsets[i]:bin_offsets[i+1]].
+        (delays, sum(num_bins), num_channels) if list of delays is given.
+    bin_offsets (ndarray): (num_trials + 1,) 
+  """
+  num_bins = np.asarray(num_bins, dtype=np.int64)
+  bin_offsets = np.concatenate([[0], np.cumsum(num_bins)])
+  total_bins = bin_offsets[-1]
+  n = num_bins[positions]
+  trial_starts = bin_offsets[positions]
+
+  delays = np.atleast_1d(delay)
+  flat_bins = []
+  for d, dl in enumerate(delays):
+    edges = accumulated_edges(win, dl, int(num_bins.max(initial=0)))
+    bins = np.searchsorted(edges, times, side='left') - 1
+    valid = (bins >= 0) & (bins < n) & (times < n*win + dl)
+    flat_bins.append(
+      ((d*total_bins + trial_starts[valid] + bins[valid])*num_channels + channels[valid])
+    )
+  counts = np.bincount(
+    np.concatenate(flat_bins), minlength=delays.size*total_bins*num_channels
+    ).reshape(delays.size, total_bins, num_channels).astype(np.int32)
+  if np.ndim(delay) == 0:
+    counts = counts[0]
+  return counts, bin_offsets
+
+
+class SentenceBuffer(Mapping):
+  """Per-sentence arrays kept in one contiguous (total_bins, ...) buffer
+  with a sentence -> (start, stop) offset table. Indexing by sent ID 
+  returns a view (same as the dict of per-sentence arrays it replaces).
+
+  Args:
+    data (ndarray): (total_bins, ...) arrays of all sents, concatenated.
+    sents (list): sent ID's, in the order they are stored in 'data'.
+    offsets (ndarray): (len(sents) + 1,) offsets of sents in 'data'.
+  """
+  def __init__(self, data, sents, offsets):
+    self.data = data
+    self.sents = list(sents)
+    self.offsets = np.asarray(offsets, dtype=np.int64)
+    self.position = {sent: x for x, sent in enumerate(self.sents)}
+
+  def __getitem__(self, sent):
+    x = self.position[sent]
+    return self.data[self.offsets[x]:self.offsets[x+1]]
+
+  def __iter__(self):
+    return iter(self.sents)
+
+  def __len__(self):
+    return len(self.sents)
+
+  def span(self, sent):
+    """Returns (start, stop) of 'sent' in 'data'."""
+    x = self.position[sent]
+    return int(self.offsets[x]), int(self.offsets[x+1])
+
+  def gather_index(self, sents=None, start=0, stop=None):
+    """Returns (lo, hi) buffer ranges of [start:stop] of each of 'sents',
+    start/stop are relative to sentence begining (scalars or one per sent)
+    and clipped to sentence length (like slicing)."""
+    if sents is None:
+      sents = self.sents
+    x = np.array([self.position[sent] for sent in sents], dtype=np.int64)
+    begins = self.offsets[x]
+    lengths = self.offsets[x + 1] - begins
+    start = np.clip(np.broadcast_to(np.asarray(start, dtype=np.int64), x.shape), 0, lengths)
+    if stop is None:
+      stop = lengths
+    stop = np.clip(np.broadcast_to(np.asarray(stop, dtype=np.int64), x.shape), start, lengths)
+    return begins + start, begins + stop
+
+  def gather(self, sents=None, start=0, stop=None):
+    """Concatenates [start:stop] of each of 'sents' along time axis with a 
+    single gather, a contiguous range of the buffer is returned as a view.
+
+    Args:
+      sents (list): sent ID's, Default: all sents (in stored order).
+      start (int or ndarray): start of each sentence, Default=0.
+      stop (int or ndarray): stop of each sentence, Default: sentence length.
+
+    Returns:
+      ndarray: (sum of lengths, ...) 
+    """
+    lo, hi = self.gather_index(sents, start, stop)
+    if lo.size > 0 and np.array_equal(lo[1:], hi[:-1]):
+      return self.data[lo[0]:hi[-1]]
+    lengths = hi - lo
+    ends = np.cumsum(lengths)
+    index = np.repeat(lo - (ends - lengths), lengths) + np.arange(ends[-1] if ends.size else 0)
+    return np.take(self.data, index, axis=0)
+
+def get_stimulus_bank(dir, mat_file=STIMULUS_MAT_FILE):
+  """Returns the process-wide stimulus bank for 'dir/mat_file', 
+  loads it on first use."""
+  mat_path = os.path.abspath(os.path.join(dir, mat_file))
+  if mat_path not in _stimulus_banks:
+    _stimulus_banks[mat_path] = StimulusBank(dir, mat_file)
+  return _stimulus_banks[mat_path]
+
+
+class StimulusBank:
+  """Stimulus (TIMIT sentences) details, shared by all sessions and objects
+  of a process (use 'get_stimulus_bank' instead of creating directly).
+  Trimmed audio of all sentences is stored as one contiguous buffer (in the
+  dtype of the .mat file, as fed to the networks) with per-sentence offsets, durations and phoneme alignments are precomputed. 
+  Arrays are memory-mapped from a cache (written once per stimulus file), so 
+  worker processes share pages instead of each holding a copy.
+  Full .mat contents ('sentences', 'sentdet', 'features') are loaded only if accessed.
+  """
+  def __init__(self, dir, mat_file=STIMULUS_MAT_FILE):
+    self.dir = dir
+    self.mat_path = os.path.join(dir, mat_file)
+    self._sentences = None
+    stat = os.stat(self.mat_path)
+    # audio kept in source dtype (banks keyed without it stored float32 audio)
+    key = hashlib.sha1(
+      f"{os.path.abspath(self.mat_path)}-{stat.st_size}-{stat.st_mtime_ns}-audio:source".encode()
+      ).hexdigest()[:16]
+    self.cache_path = os.path.join(cache_dir, 'stimulus_bank', key)
+    if os.path.isfile(os.path.join(self.cache_path, 'meta.json')):
+      self.arrays, meta = self.read_cache()
+    else:
+      self.arrays, meta = self.compile()
+    self.fs = meta['fs']
+    self.num_sents = meta['num_sents']
+
+  @property
+  def sentences(self):
+    if self._sentences is None:
+      self._sentences = io.loadmat(self.mat_path, struct_as_record = False, squeeze_me = True, )
+    return self._sentences
+
+  @property
+  def sentdet(self):
+    return self.sentences['sentdet']
+
+  @property
+  def features(self):
+    return self.sentences['features']
+
+  @property
+  def phn_names(self):
+    return self.arrays['phn_names']
+
+  def compile(self):
+    """Reads stimulus .mat file and writes the flat arrays to cache,
+    arrays are kept in memory if cache can not be written."""
+    sentdet = self.sentdet
+    #since fs is the same for all sentences, using fs for the first sentence
+    fs = int(sentdet[0].soundf)
+    bef, aft = 0.5, 0.5
+    audio, phonemes, durations = [], [], []
+    for det in sentdet:
+      audio.append(np.asarray(det.sound[int(bef*det.soundf):-int(aft*det.soundf)]))
+      durations.append(det.duration - (bef + aft))
+      #indices where phoneme exists
+      phoneme_present = np.amax(det.phnmat, axis=0)
+      # one-hot-encoding to indices (these may carry 0 where no phoneme is present)
+      indices = np.argmax(det.phnmat, axis = 0)
+      #eliminate 0's for no phonemes
+      phonemes.append(indices[np.where(phoneme_present>0)])
+    arrays = {
+      'audio': np.concatenate(audio),
+      'audio_offsets': np.concatenate([[0], np.cumsum([a.size for a in audio])]).astype(np.int64),
+      'durations': np.array(durations, dtype=np.float64),
+      'phonemes': np.concatenate(phonemes).astype(np.int32),
+      'phoneme_offsets': np.concatenate([[0], np.cumsum([p.size for p in phonemes])]).astype(np.int64),
+      'phn_names': np.asarray(self.sentences['phnnames'], dtype=str),
+    }
+    meta = {'fs': fs, 'num_sents': len(sentdet)}
+    # written to a unique temporary directory and renamed in place (see 'publish_dir'),
+    # concurrent jobs compiling the same bank keep the first complete cache.
+    tmp_path = unique_path(self.cache_path)
+    try:
+      os.makedirs(tmp_path)
+      for name, value in arrays.items():
+        np.save(os.path.join(tmp_path, f'{name}.npy'), value)
+      with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+      publish_dir(
+        tmp_path, self.cache_path, lambda path: os.path.isfile(os.path.join(path, 'meta.json'))
+      )
+    except OSError as err:
+      shutil.rmtree(tmp_path, ignore_errors=True)
+      print(f"(stimulus bank not cached: {err}) ", end='')
+      return arrays, meta
+    return self.read_cache()
+
+  def read_cache(self):
+    """Memory-maps arrays of the cached stimulus bank."""
+    with open(os.path.join(self.cache_path, 'meta.json'), 'r') as f:
+      meta = json.load(f)
+    arrays = {}
+    for name in ['audio', 'audio_offsets', 'durations', 'phonemes', 'phoneme_offsets', 'phn_names']:
+      arrays[name] = np.load(os.path.join(self.cache_path, f'{name}.npy'), mmap_mode='r')
+    return arrays, meta
+
+  def sent_index(self, sent):
+    # subtracting 1 because timitStimcodes range [1,500) and sent indices range [0,499)
+    index = int(sent) - 1
+    if index < 0:
+      index += self.num_sents
+    return index
+
+  def phoneme(self, sent=1):
+    i = self.sent_index(sent)
+    offsets = self.arrays['phoneme_offsets']
+    return self.phn_names[self.arrays['phonemes'][offsets[i]:offsets[i+1]]]
+
+  def audio(self, sent=1):
+    i = self.sent_index(sent)
+    offsets = self.arrays['audio_offsets']
+    return np.asarray(self.arrays['audio'][offsets[i]:offsets[i+1]])
+
+  def duration(self, sent=1):
+    return float(self.arrays['durations'][self.sent_index(sent)])
+
 
 class NeuralData:
   """Neural_dataset class loads neural data, from the directory specified at creation & 
@@ -13,83 +493,172 @@ class NeuralData:
   'dir': (String) Path to the directory containing data files and the json_file.
   'json_file': (String) Default: 'Neural_data_files.json' specifies data files to be loaded.
   """
-  def __init__(self, dir, sub,  mat_file = 'out_sentence_details_timit_all_loudness.mat', verbose=False):
+  def __init__(self, dir, sub,  mat_file = STIMULUS_MAT_FILE, verbose=False):
     print(f"Loading Neural data for session: {sub} ... ", end='')
     self.sub = sub
     self.dir = dir
-    self.sentences = io.loadmat(os.path.join(self.dir, mat_file), struct_as_record = False, squeeze_me = True, )
-    self.features = self.sentences['features']
-    self.phn_names = self.sentences['phnnames']
-    self.sentdet = self.sentences['sentdet']
-    self.fs = self.sentdet[0].soundf   #since fs is the same for all sentences, using fs for the first sentence
+    # stimulus details are shared by all sessions (loaded once per process)
+    self.mat_file = mat_file
+    self.stimuli = get_stimulus_bank(self.dir, mat_file)
+    self.fs = self.stimuli.fs
     self.names = os.listdir(os.path.join(self.dir, self.sub)) 
     # print(self.names)
+    self.spike_data = None
+    self.trial_offsets = None
     self.spikes, self.trials = self.load_data(verbose=verbose)
     self.num_channels = len(self.spikes.keys())
+    self.index_spikes()
     self.sents = np.arange(1,500)
     self.sent_sections = {}
+    self.spike_pyramid = None
+    # (bin_width, delay) of 'raw_spikes', None until spikes are extracted
+    self.spikes_key = None
 
     print("Done.")
     # print(f"Data from {self.num_channels} channels loaded...!")
 
   def load_data(self, verbose):
     """ Loads data from __MUspk.mat files and returns a tuple of dictionaries. 
-    Takes in the path of directory having the __MUspk.mat files and json file 
-    with filenames to load. 
+    Memory-maps the compiled store (see 'compile_session') if it exists and is
+    up-to-date, otherwise reads the __MUspk.mat files.
     'dir: (string) address of location with __MUspk.mat files
     'j_file': (string) json file with names of __Muspk.mat files to load
     Returns:
     (spikes, trials): 1st carries dictionary of spike structs read from __MUspk files
     and second one carries dictionary of trial structs.
     """
+    layout = self.compiled_layout()
+    if layout is not None:
+      return self.load_compiled(layout)
     path = os.path.join(self.dir, self.sub)
     spikes = {}
     trials = {}
     data = {}
-    self.names.sort()
-    for i, name in enumerate(self.names):
+    names = sorted(name for name in self.names if 'MUspk' in name)
+    for i, name in enumerate(names):
       if verbose:
         print(name)
-      if 'MUspk' in name:
-        # print(name)
-        data[i] = io.loadmat(os.path.join(path,name), squeeze_me = True, struct_as_record = False)
-        spikes[i] = data[i]['spike']
-        trials[i] = data[i]['trial']
+      data[i] = io.loadmat(os.path.join(path,name), squeeze_me = True, struct_as_record = False)
+      spikes[i] = data[i]['spike']
+      trials[i] = data[i]['trial']
     
     return spikes, trials
 
+  def compiled_layout(self):
+    """Returns layout of the compiled store for the session, 
+    or None if store does not exist or is out of date."""
+    layout_file = os.path.join(self.dir, self.sub, COMPILED_DIR, COMPILED_LAYOUT)
+    if not os.path.isfile(layout_file):
+      return None
+    with open(layout_file, 'r') as f:
+      layout = json.load(f)
+    if layout['fingerprint'] != source_fingerprint(self.dir, self.sub):
+      print("(compiled spikes out of date, reading .mat files) ", end='')
+      return None
+    return layout
+
+  def load_compiled(self, layout):
+    """Memory-maps the compiled store, and returns (spikes, trials) dicts
+    of per-channel views that have the same fields as the .mat structs."""
+    path = os.path.join(self.dir, self.sub, COMPILED_DIR)
+    arrays = {
+      field: np.load(os.path.join(path, f'{field}.npy'), mmap_mode='r')
+      for field in layout['spike_fields']
+    }
+    offsets = np.load(os.path.join(path, 'channel_offsets.npy'))
+    self.spike_data = arrays
+    self.channel_offsets = offsets
+    offsets_file = os.path.join(path, 'trial_offsets.npy')
+    if os.path.isfile(offsets_file):
+      self.trial_offsets = np.load(offsets_file)
+    trial = SimpleNamespace(**{
+      field: np.load(os.path.join(path, f'trial_{field}.npy'), mmap_mode='r')
+      for field in layout['trial_fields']
+    })
+    spikes = {}
+    trials = {}
+    for i in range(len(layout['channels'])):
+      spikes[i] = SimpleNamespace(**{
+        field: value[offsets[i]:offsets[i+1]] for field, value in arrays.items()
+      })
+      trials[i] = trial
+    return spikes, trials
+
+  def index_spikes(self):
+    """Builds index of spikes sorted by (channel, trial), so that spikes of any 
+    (channel, trial) are a slice of flat arrays in 'self.spike_data' and spikes 
+    of all channels for trials are a single gather. Also builds the map of 
+    stimcode -> trials used by 'get_trials'."""
+    if self.spike_data is None:
+      # spikes read from .mat files, flatten them same as the compiled store.
+      fields = {field: [] for field in SPIKE_FIELDS}
+      offsets = [0]
+      for i in range(self.num_channels):
+        values = {field: np.atleast_1d(getattr(self.spikes[i], field)) for field in SPIKE_FIELDS}
+        order = np.lexsort((values['stimlock'], values['trial']))
+        for field in SPIKE_FIELDS:
+          fields[field].append(values[field][order])
+        offsets.append(offsets[-1] + order.size)
+      self.spike_data = {field: np.concatenate(fields[field]) for field in SPIKE_FIELDS}
+      self.spike_data['trial'] = self.spike_data['trial'].astype(np.int32)
+      self.channel_offsets = np.array(offsets, dtype=np.int64)
+
+    stimcodes = np.asarray(self.trials[0].timitStimcode).astype(np.int64)
+    if self.trial_offsets is None:
+      self.trial_offsets = index_trials(self.spike_data['trial'], self.channel_offsets, stimcodes.size)
+
+    # trials (indices) sorted by stimcode, trials of 'sent' are at [stim_offsets[sent]:stim_offsets[sent+1]]
+    self.stim_trials = np.argsort(stimcodes, kind='stable')
+    self.stim_offsets = np.searchsorted(
+      stimcodes[self.stim_trials], np.arange(stimcodes.max(initial=0) + 2), side='left'
+    )
+
+  def gather_spikes(self, trials, field='stimlock'):
+    """Gathers spikes of all channels for a batch of trials (single gather
+    using the CSR index).
+
+    Args:
+        trials (list): trial ID's.
+        field (str): 'stimlock' (relative times) or 'spktimes' (absolute times).
+
+    Returns:
+        values (ndarray): (num_spikes,) spike times.
+        channels (ndarray): (num_spikes,) channel index of each spike.
+        positions (ndarray): (num_spikes,) position (in batch) of trial of each spike.
+    """
+    trials = np.asarray(trials, dtype=np.int64)
+    starts = self.trial_offsets[:, trials].ravel()
+    lengths = self.trial_offsets[:, trials + 1].ravel() - starts
+    seg_offsets = np.cumsum(lengths) - lengths
+    indices = np.repeat(starts - seg_offsets, lengths) + np.arange(lengths.sum())
+    channels = np.repeat(np.repeat(np.arange(self.num_channels), trials.size), lengths)
+    positions = np.repeat(np.tile(np.arange(trials.size), self.num_channels), lengths)
+    return np.asarray(self.spike_data[field])[indices], channels, positions
+
+  @property
+  def sentences(self):
+    return self.stimuli.sentences
+
+  @property
+  def sentdet(self):
+    return self.stimuli.sentdet
+
+  @property
+  def features(self):
+    return self.stimuli.features
+
+  @property
+  def phn_names(self):
+    return self.stimuli.phn_names
+
   def phoneme(self, sent=1):
-    # subtracting 1 because timitStimcodes range [1,500) and sent indices range [0,499)
-    sent -= 1
-     
-    #indices where phoneme exists
-    phoneme_present = np.amax(self.sentdet[sent].phnmat, axis=0)
-    # one-hot-encoding to indices (these may carry 0 where no phoneme is present)
-    indices = np.argmax(self.sentdet[sent].phnmat, axis = 0)
-    #eliminate 0's for no phonemes
-    indices = indices[np.where(phoneme_present>0)]
-    return self.phn_names[indices]
+    return self.stimuli.phoneme(sent)
   
   def audio(self, sent=1):
-    # subtracting 1 because timitStimcodes range [1,500) and sent indices range [0,499)
-    sent -= 1
-    fs = self.sentdet[sent].soundf
-    bef, aft = 0.5, 0.5
-    #bef = self.sentdet[sent].befaft[0]
-    #aft = self.sentdet[sent].befaft[1]
-    sound = self.sentdet[sent].sound
-    sound = sound[int(bef*fs):-int(aft*fs)]
-    
-    return sound
+    return self.stimuli.audio(sent)
 
   def duration(self, sent=1):
-    # subtracting 1 because sent_id =1 is stored at index 0 in sentdet and so on...
-    sent -= 1
-    bef, aft = 0.5, 0.5
-    #bef = self.sentdet[sent].befaft[0]
-    #aft = self.sentdet[sent].befaft[1]
-    duration = self.sentdet[sent].duration - (bef + aft)
-    return duration
+    return self.stimuli.duration(sent)
 
   def audio_phoneme_data(self):
     audio = {}
@@ -108,25 +677,20 @@ class NeuralData:
     # Using channel 0 trials dict to get list of trials for 'sent', but trials for all the channels are the same 
     #only the outcome 'spikes' can vary, so that is the reason of not using spikes
     
-    try: 
-      trials = (np.where(self.trials[0].timitStimcode == sent)[0]) + 1          # adding 1 to match the indexes
-      return trials
-    except:
-      print("No trial data found...!")
-    
+    sent = int(sent)
+    if sent < 0 or sent + 1 >= self.stim_offsets.size:
+      # no trials for 'sent', (empty, same as scanning 'timitStimcode')
+      return np.zeros(0, dtype=self.stim_trials.dtype)
+    trials = self.stim_trials[self.stim_offsets[sent]:self.stim_offsets[sent+1]] + 1          # adding 1 to match the indexes
+    return trials
+
 
   def retrieve_spike_counts_for_all_trials(self, sent, win=50, delay=0):
-    
+    """Returns dict of spike counts (channel: (trials, time)) for all trials of 'sent',
+    (see 'get_repeated_trials')."""
     trials = self.get_trials(sent)
-    spk = self.retrieve_spike_counts(trial=trials[0], win = win, delay=delay)
-    spikes = {i:np.zeros((len(trials), spk[0].shape[0])) for i in range(self.num_channels)}
-    for i in range(self.num_channels):
-        spikes[i][0] = spk[i]
-    for x, tr in enumerate(trials[1:]):
-        spikes_tr = self.retrieve_spike_counts(trial=tr, win = win, delay=delay)
-        for i in range(self.num_channels):
-            spikes[i][x+1] = spikes_tr[i]
-    return spikes
+    counts = self.get_repeated_trials(sents=[sent], bin_width=win, delay=delay, repeats=len(trials))
+    return {i: counts[:,:,i].astype(np.float64) for i in range(self.num_channels)}
 
   def retrieve_spike_times(self, sent=212, trial = 0 , timing_type = 'relative'):
     """Returns times of spikes, relative to stimulus onset or absolute time
@@ -149,18 +713,14 @@ class NeuralData:
     else:
       #print('Please provide Trial # corresponding to the provided sentence using of spike.trial')
       tr = trial
-    # ADDED one to i to make it match indices
+    # spikes of (channel, trial) are a slice of flat arrays (see 'index_spikes')
     for i in range(self.num_channels):
-      #spike_indices to index through spike fields
-      # print("here: ",i, tr)
-      # j = i+1
-      j = i
-      spike_indices = np.where(self.spikes[j].trial == tr)
+      start, stop = self.trial_offsets[i, tr], self.trial_offsets[i, tr+1]
       #spike times relative to the stimuls On time (Stimon)
       if timing_type == 'relative':
-        s_times[i] = self.spikes[j].stimlock[spike_indices]   
+        s_times[i] = np.asarray(self.spike_data['stimlock'][start:stop])
       elif timing_type == 'absolute':
-        s_times[i] = self.spikes[j].spktimes[spike_indices]   
+        s_times[i] = np.asarray(self.spike_data['spktimes'][start:stop])
     
     return s_times
 
@@ -182,37 +742,53 @@ class NeuralData:
         sent = self.trials[0].timitStimcode[trial]
     win = win/1000
     delay = delay/1000
-    bins = {}             #miliseconds
-	# round the 3rd decimal digit, before ceiling...!
-    n = int(np.ceil(round(self.duration(sent)/win, 3)))
+    n = self.sent_bins(sent, win)
+
+    times = np.concatenate([s_times[i] for i in range(self.num_channels)])
+    channels = np.repeat(np.arange(self.num_channels), [s_times[i].size for i in range(self.num_channels)])
+    counts, _ = count_spikes(
+      times, channels, np.zeros(times.size, dtype=np.int64), [n], self.num_channels, win, delay
+    )
+    bins = {i: counts[:, i] for i in range(self.num_channels)}
+    return bins
+
+  def sent_bins(self, sent, win):
+    """Returns number of bins (of 'win' sec) for sentence 'sent', and
+    stores boundaries of sent thirds in 'self.sent_sections'."""
+    n = num_bins(self.duration(sent), win)
     
     # store boundaries of sent thirds...
     one_third = int(n/3)
     two_third = int(2*n/3)
     self.sent_sections[sent] = [0, one_third, two_third, n] 
+    return n
 
+  def bin_trials(self, trials, win=50, delay=0, bins=None):
+    """Bins spikes of all channels for a batch of trials, in one vectorized call.
 
-    for i in range(self.num_channels):
-      tmp = np.zeros(n, dtype=np.int32) 
-      j = 0
-      st = delay
-      en = st+win                  #End time for ongoing search window
-      for val in s_times[i]:
-        if val < (tmp.size * win + delay):
-          if (val<= en and val>st):
-            tmp[j] += 1
-            
-          elif val>en:    
-            while(val > en):
-              j += 1
-              st += win
-              en += win
-            if j<n:
-              tmp[j] += 1
-            
-      bins[i] = tmp
-    
-    return bins
+    Args:
+        trials (list): trial ID's (as returned by 'get_trials').
+        win (int): miliseconds specifing the width of time slots for bins.
+        delay (ms or list): Delaying the features versus spikes, list of delays
+            gives counts for all the delays (spikes are gathered only once).
+        bins (list): number of bins for each trial, Default: computed from
+            duration of the sentence (same as 'create_bins').
+
+    Returns:
+        counts (ndarray): (total_bins, channels) ragged array, counts of i-th trial 
+            are counts[bin_offsets[i]:bin_offsets[i+1]]. 
+            (delays, total_bins, channels) for list of delays.
+        bin_offsets (ndarray): (len(trials) + 1,)
+    """
+    trials = np.asarray(trials, dtype=np.int64)
+    win = win/1000
+    delay = np.asarray(delay)/1000
+    sents = np.asarray(self.trials[0].timitStimcode)[trials - 1].astype(np.int64)
+    if bins is None:
+      bins = [self.sent_bins(sent, win) for sent in sents]
+
+    times, channels, positions = self.gather_spikes(trials)
+    return count_spikes(times, channels, positions, bins, self.num_channels, win, delay)
 
   def retrieve_spike_counts(self, sent=212, trial = 0, win = 50, delay=0):
     """Returns number of spikes in every 'win' miliseconds duration following the 
@@ -236,27 +812,173 @@ class NeuralData:
     # and they both give the same output
     s_times = self.retrieve_spike_times(sent=sent, trial=trial)
     win = win/1000
-    counts = {}
    
     duration = round(self.duration(sent),3)  #round off to 3 decimals...
     bins = np.arange(delay, delay + duration, win)
-    for i in range(self.num_channels):
-        counts[i], _ = np.histogram(s_times[i], bins)
-    return counts
+    n = bins.size - 1
+    times = np.concatenate([s_times[i] for i in range(self.num_channels)])
+    channels = np.repeat(np.arange(self.num_channels), [s_times[i].size for i in range(self.num_channels)])
+    # left-closed bins, last bin closed on both sides (same as np.histogram)
+    idx = np.searchsorted(bins, times, side='right') - 1
+    idx[times == bins[-1]] = n - 1
+    valid = (idx >= 0) & (idx < n)
+    counts = np.bincount(channels[valid]*n + idx[valid], minlength=self.num_channels*n)
+    counts = counts.reshape(self.num_channels, n)
+    return {i: counts[i] for i in range(self.num_channels)}
 
   def extract_spikes(self, bin_width=20, delay=0, sents = None):
     """Return neural spikes for given sents"""
     if sents is None:
         sents = self.sents
-    raw_spikes = {}
-    for x,i in enumerate(sents):
-        spikes = self.retrieve_spike_counts(sent=i,win=bin_width,delay=delay)
-        raw_spikes[i] = np.stack([spikes[ch] for ch in range(self.num_channels)], axis=1)
-    self.raw_spikes =  raw_spikes
+    sents = list(dict.fromkeys(sents))
+    self.spikes_key = (bin_width, delay)
+    if self.pyramid_covers(bin_width, delay, sents):
+        self.raw_spikes = self.pyramid_spikes(bin_width)
+        return
+    trials = [self.get_trials(sent)[0] for sent in sents]
+    counts, bin_offsets = self.bin_trials(trials, win=bin_width, delay=delay)
+    self.raw_spikes = SentenceBuffer(counts, sents, bin_offsets)
+
+  def build_spike_pyramid(self, bin_widths, delay=0, sents=None):
+    """Bins spikes once for all 'bin_widths', counts of every width are then
+    derived (lazily, by 'pyramid_spikes') by summing adjacent elementary bins. 
+    Elementary bins are delimited by the union of bin edges of all widths 
+    (the same floating point edges as 'bin_trials'), every bin of every width 
+    is exactly a run of elementary bins, so derived counts are equal to direct
+    binning. Number of bins for every width follows the same rounding as 
+    'duration' (and 'sent_sections').
+    While the pyramid exists, 'extract_spikes' reuses it for matching 
+    (bin_width, delay, sents).
+
+    Args:
+        bin_widths (list): bin widths (ms).
+        delay (int): delay (ms).
+        sents (list): sent ID's, Default: all sents.
+    """
+    bin_widths = list(dict.fromkeys(int(w) for w in bin_widths))
+    if sents is None:
+        sents = self.sents
+    sents = list(dict.fromkeys(sents))
+    dl = np.asarray(delay)/1000
+    durations = [self.duration(sent) for sent in sents]
+    bins = {w: np.array([num_bins(d, w/1000) for d in durations], dtype=np.int64) for w in bin_widths}
+    # edges of every width (as in 'count_spikes'), and their union...
+    edges = {w: accumulated_edges(w/1000, dl, int(bins[w].max(initial=0))) for w in bin_widths}
+    merged = np.unique(np.concatenate(list(edges.values())))
+    positions = {w: np.searchsorted(merged, edges[w]) for w in bin_widths}
+    # elementary bins of each trial, up to the last edge of its longest width
+    extents = np.max([positions[w][bins[w]] for w in bin_widths], axis=0)
+    elem_offsets = np.concatenate([[0], np.cumsum(extents)])
+
+    trials = [self.get_trials(sent)[0] for sent in sents]
+    times, channels, trial_pos = self.gather_spikes(trials)
+    elem = np.searchsorted(merged, times, side='left') - 1
+    valid = (elem >= 0) & (elem < extents[trial_pos])
+    counts = np.bincount(
+      (elem_offsets[trial_pos[valid]] + elem[valid])*self.num_channels + channels[valid],
+      minlength=elem_offsets[-1]*self.num_channels
+      ).reshape(elem_offsets[-1], self.num_channels)
+    # cumulative counts, (total spikes of a channel fit in int32)
+    cumulative = np.zeros((elem_offsets[-1] + 1, self.num_channels), dtype=np.int32)
+    np.cumsum(counts, axis=0, out=cumulative[1:])
+
+    # spikes at or after the cut-off (n*win + delay) of the last bin are dropped by 
+    # 'count_spikes', cut-off differs from the last edge only by rounding...
+    corrections = {}
+    for w in bin_widths:
+      n = bins[w][trial_pos]
+      dropped = (n > 0) & (times >= n*(w/1000) + dl) & (times <= edges[w][n]) \
+          & (times > edges[w][np.maximum(n - 1, 0)])
+      if np.any(dropped):
+        corrections[w] = (trial_pos[dropped], channels[dropped])
+
+    self.spike_pyramid = {
+        'bin_widths': bin_widths,
+        'delay': delay,
+        'sents': sents,
+        'bins': bins,
+        'positions': positions,
+        'elem_offsets': elem_offsets,
+        'cumulative': cumulative,
+        'corrections': corrections,
+        'levels': {},
+    }
+
+  def pyramid_covers(self, bin_width, delay, sents):
+    """Returns True if spikes at 'bin_width' can be derived from the pyramid."""
+    pyramid = self.spike_pyramid
+    return (
+        pyramid is not None and bin_width in pyramid['bin_widths']
+        and delay == pyramid['delay'] and list(sents) == pyramid['sents']
+    )
+
+  def pyramid_spikes(self, bin_width):
+    """Returns spikes (SentenceBuffer, sent: (time, channel)) at 'bin_width' derived from the 
+    pyramid (see 'build_spike_pyramid'), levels are cached when first used."""
+    pyramid = self.spike_pyramid
+    if pyramid is None or bin_width not in pyramid['bin_widths']:
+        raise ValueError(f"Bin width: {bin_width}ms not in the spike pyramid, use 'build_spike_pyramid' first.")
+    sents = pyramid['sents']
+    for sent in sents:
+        self.sent_bins(sent, bin_width/1000)
+    if bin_width not in pyramid['levels']:
+        bins = pyramid['bins'][bin_width]
+        positions = pyramid['positions'][bin_width]
+        bin_offsets = np.concatenate([[0], np.cumsum(bins)])
+        # j-th bin of i-th trial spans elementary bins [positions[j], positions[j+1])
+        trial = np.repeat(np.arange(bins.size), bins)
+        j = np.arange(bin_offsets[-1]) - bin_offsets[trial]
+        base = pyramid['elem_offsets'][trial]
+        cumulative = pyramid['cumulative']
+        counts = cumulative[base + positions[j+1]] - cumulative[base + positions[j]]
+        if bin_width in pyramid['corrections']:
+            trial_pos, channels = pyramid['corrections'][bin_width]
+            np.subtract.at(counts, (bin_offsets[trial_pos + 1] - 1, channels), 1)
+        pyramid['levels'][bin_width] = (counts, bin_offsets)
+    counts, bin_offsets = pyramid['levels'][bin_width]
+    return SentenceBuffer(counts, sents, bin_offsets)
+
+  def extract_delayed_spikes(self, bin_width=20, delays=None, sents=None):
+    """Bins neural spikes for a grid of delays in one pass and keeps the 
+    (delay, time, channel) tensor, use 'select_delay' to set 'raw_spikes'
+    for one of the delays.
+
+    Args:
+        bin_width (int): bin width in ms.
+        delays (list): delays (ms) to bin spikes for.
+        sents (list): sent ID's, Default: all sents.
+    """
+    if delays is None:
+        delays = [0, 10, 20, 30]
+    if sents is None:
+        sents = self.sents
+    sents = list(dict.fromkeys(sents))
+    trials = [self.get_trials(sent)[0] for sent in sents]
+    self.delayed_spikes, self.delayed_bin_offsets = self.bin_trials(
+        trials, win=bin_width, delay=delays
+    )
+    self.delays_grid = list(delays)
+    self.delayed_sents = sents
+    self.delayed_bin_width = bin_width
+
+  def select_delay(self, delay):
+    """Sets 'raw_spikes' to spikes at 'delay' (ms), sliced from the tensor
+    binned by 'extract_delayed_spikes' (no re-binning)."""
+    try:
+        d = self.delays_grid.index(delay)
+    except (AttributeError, ValueError):
+        raise ValueError(f"Spikes for delay: {delay}ms not binned, use 'extract_delayed_spikes' first.")
+    for sent in self.delayed_sents:
+        self.sent_bins(sent, self.delayed_bin_width/1000)
+    self.raw_spikes = SentenceBuffer(
+        self.delayed_spikes[d], self.delayed_sents, self.delayed_bin_offsets
+    )
+    self.spikes_key = (self.delayed_bin_width, delay)
 
   def unroll_spikes(self, sents=None, features_delay_trim=None, third=None):
     """
-    Unroll and concatenate time axis of extracted spikes.
+    Unroll and concatenate time axis of extracted spikes, (single gather
+    from the contiguous 'raw_spikes' buffer, a view if sents are contiguous).
 
     Args:
         sents (List): indices of sents.
@@ -267,15 +989,17 @@ class NeuralData:
     """
     if sents is None:
       sents = self.raw_spikes.keys()
+    sents = list(sents)
 
     if features_delay_trim is None:
        trim = 0
     else:
        trim = features_delay_trim
     if third is None:
-      spikes = np.concatenate([self.raw_spikes[sent][trim:] for sent in sents], axis=0)
+      spikes = self.raw_spikes.gather(sents, start=trim)
     else:
-       spikes = np.concatenate([self.raw_spikes[sent][self.sent_sections[sent][third-1]:self.sent_sections[sent][third]] for sent in sents], axis=0)
+       sections = np.array([self.sent_sections[sent] for sent in sents], dtype=np.int64).reshape(-1, 4)
+       spikes = self.raw_spikes.gather(sents, start=sections[:, third-1], stop=sections[:, third])
     return spikes
 
   def load_spikes(self, bin_width=20, delay=0, sents=None):
@@ -286,27 +1010,47 @@ class NeuralData:
     )
     return self.unroll_spikes()
 
-  def get_repeated_trials(self, sents=None, bin_width=20, delay=0):
-      """Get repeated trials for given sents as 'ndarray'. """
+  def get_repeated_trials(self, sents=None, bin_width=20, delay=0, repeats=None):
+      """Get repeated trials for given sents as 'ndarray', all trials of all sents
+      are binned in one vectorized pass (see 'bin_trials').
+
+      Args:
+          sents (list): sent ID's, Default: REPEATED_SENTS.
+          bin_width (int): bin width in ms.
+          delay (ms or list): delay, list of delays gives tensor for every delay.
+          repeats (int): number of trials (first 'repeats' trials of each sent),
+              Default: minimum number of trials over sents (mostly it is 11).
+
+      Returns:
+          ndarray: (repeats, time, channels) spike counts, time axis is 
+              concatenation of sents. (delays, repeats, time, channels) for list of delays.
+      """
       if sents is None:
-          sents = [12,13,32,43,56,163,212,218,287,308]
-      spikes_dict = {}
-      min_repeats = 500   #repetition of trials (mostly it is 11)
-      for s in sents:
-          spikes_sentence = self.retrieve_spike_counts_for_all_trials(sent=s, win = bin_width, delay=delay)
-          spikes_dict[s] = np.stack([spikes_sentence[ch] for ch in range(self.num_channels)], axis=-1)
-          if spikes_dict[s].shape[0] < min_repeats:
-              min_repeats = spikes_dict[s].shape[0] 
-      all_repeated_trials = np.concatenate([spikes_dict[s][:min_repeats,:,:] for s in sents], axis=1)
-      return all_repeated_trials
+          sents = REPEATED_SENTS
+      sent_trials = [self.get_trials(s) for s in sents]
+      if repeats is None:
+          repeats = min(len(trials) for trials in sent_trials)
+      # trials ordered by (repeat, sent), so each repeat is a contiguous block of bins...
+      trials = np.stack([trials[:repeats] for trials in sent_trials], axis=1).ravel()
+      counts, _ = self.bin_trials(trials, win=bin_width, delay=delay)
+      return counts.reshape(counts.shape[:-2] + (repeats, -1, self.num_channels))
 
   def get_normalizer(self, sents=None, bin_width=20, delay=0, n=1000):
-      """Compute dist. of normalizer and return median."""
+      """Compute dist. of normalizer and return median, 
+      n=None uses exact distribution over all pairs of trials.
+      Results are cached on disk (see 'load_normalizer')."""
       if sents is None:
-          sents = [12,13,32,43,56,163,212,218,287,308]
+          sents = REPEATED_SENTS
+      cached = load_normalizer(self.dir, self.sub, sents, bin_width, delay, n, self.mat_file)
+      if cached is not None:
+          return cached[1]
       all_repeated_trials = self.get_repeated_trials(sents=sents, bin_width=bin_width, delay=delay)
       normalizer_all = utils.inter_trial_corr(all_repeated_trials, n=n)
       normalizer_all_med = np.median(normalizer_all, axis=0)
+      save_normalizer(
+          self.dir, self.sub, normalizer_all, normalizer_all_med,
+          sents, bin_width, delay, n, self.mat_file
+      )
       return normalizer_all_med
 
 
@@ -320,17 +1064,12 @@ class NeuralData:
 
     #Repeated trials for following timitStimcodes only
     #sents = [12,13,32,43,56,163,212,218,287,308]
-    spikes = {}
-    max_time = 0
     #fig = plt.figure(figsize=(12,6))
     trials = self.get_trials(sent=sent)
-    for i, tr in enumerate(trials):
-        spikes[i] = self.retrieve_spike_times(sent=sent, trial=tr)[ch]
-        mx = np.amax(spikes[i], axis=0)
-        if mx > max_time:
-            max_time = mx 
-        #print(spikes[i].shape)
-        plt.eventplot(spikes[i], lineoffsets=i+1, linelengths=0.3, linestyles='-', linewidths=8)
+    times, channels, positions = self.gather_spikes(trials)
+    times, positions = times[channels == ch], positions[channels == ch]
+    for i in range(len(trials)):
+        plt.eventplot(times[positions == i], lineoffsets=i+1, linelengths=0.3, linestyles='-', linewidths=8)
     plt.xlim(0,self.duration(sent))
     plt.xlabel('Time (s)', fontsize=14)
     plt.ylabel('Trials', fontsize=14)
@@ -338,17 +1077,8 @@ class NeuralData:
     
   def psth(self, sent=12, ch=9, win = 40):
     trials = self.get_trials(sent=sent)
-    spikes = {}
-    #fig = plt.figure(figsize=(12,6))
-    for i, tr in enumerate(trials):
-        spikes[i] = self.retrieve_spike_counts(sent=12, trial=tr, win=win)[ch]
-        if i==0:
-            psth = np.zeros(spikes[i].shape[0])
-        psth += spikes[i]
-        #print(spikes[i].shape)
-    #print(psth.shape)
- 
-    psth /= trials.size
+    counts = self.get_repeated_trials(sents=[sent], bin_width=win, repeats=len(trials))
+    psth = counts[:,:,ch].sum(axis=0) / trials.size
     edges = np.float64(np.arange(0, psth.shape[0]))*win/1000
 
     return edges, psth
@@ -359,17 +1089,17 @@ class NeuralData:
     #plt.title(f"PSTH session: {self.sub}, sentence: {sent}, ch: '{self.names[ch]}', bin: {win}", fontsize=14, fontweight='bold')
 
     
-  def signal_power(self, win, ch, sents = [12,13,32,43,56,163,212,218,287,308]):
-    
+  def signal_power(self, win, ch=None, sents = REPEATED_SENTS):
+    """Returns signal power of channel 'ch', (all channels if ch is None)."""
     sp = 0
     for s in sents:
-        r = self.retrieve_spike_counts_for_all_trials(sent=s, w=win)[ch]
+        r = self.get_repeated_trials(sents=[s], bin_width=win, repeats=len(self.get_trials(s)))
         N = r.shape[0]
         trail_sum = np.sum(r, axis=0)
         n1 = np.var(trail_sum, axis=0)
-        n2 = 0
-        for i in range(r.shape[0]):
-            n2 += np.var(r[i])
+        n2 = np.var(r, axis=1).sum(axis=0)
         sp += (n1 - n2)/(N*(N-1))
     sp /= len(sents)
-    return sp
\ No newline at end of file
+    if ch is None:
+        return sp
+    return sp[ch]
@@ -5,26 +5,41 @@ import numpy as np
 from torch import nn, Tensor
 from abc import ABC, abstractmethod
 
-from transformers import Wav2Vec2Processor, Wav2Vec2ForCTC
-from transformers import Speech2TextForConditionalGeneration, Speech2TextProcessor
-from transformers import AutoProcessor, WhisperForConditionalGeneration
-
 # local
 from auditory_cortex import config_dir, results_dir, aux_dir
-from wav2letter.models import Wav2LetterRF
+from auditory_cortex.feature_store import checkpoint_fingerprint
+from auditory_cortex.frontend_cache import get_frontend_cache
+# model family packages (transformers, wav2letter, fairseq, deepspeech_pytorch) 
+# are imported by the extractor that needs them.
 
 # import GPU specific packages...
 from auditory_cortex import hpc_cluster
 if hpc_cluster:
     import cupy as cp
-    import fairseq
-    from deepspeech_pytorch.model import DeepSpeech
-    import deepspeech_pytorch.loader.data_loader as data_loader
-    from deepspeech_pytorch.configs.train_config import SpectConfig
+
+
+class StopForward(Exception):
+    """Raised by the feature hooks to abort the forward pass, once all
+    the requested layers have been captured (see 'FeatureExtractor.translate')."""
+
+
+def quantize_dynamic(model):
+    """Returns 'model' with dynamic int8 quantization of linear and recurrent 
+    layers (int8 weights, activations quantized on the fly), for CPU inference.
+    Module names are unchanged, so hooks are registered as for the float model."""
+    return torch.ao.quantization.quantize_dynamic(
+        model, {nn.Linear, nn.LSTM, nn.GRU}, dtype=torch.qint8
+    )
 
 
 class FeatureExtractor():
-    def __init__(self, model_name = 'wave2letter_modified'):
+    def __init__(self, model_name = 'wave2letter_modified', quantize=None):
+        """
+        Args:
+            model_name (str): name of the network ('{model_name}_config.yml' in aux_dir).
+            quantize (bool): dynamic int8 quantization of linear/recurrent layers
+                (CPU inference only, no gradients), Default: 'quantize' in config.
+        """
         
         self.layers = []
         self.layer_ids = []
@@ -62,6 +77,18 @@ class FeatureExtractor():
             self.extractor = FeatureExtractorW2V(checkpoint)
         else:
             raise NotImplementedError(f"FeatureExtractor class does not support '{model_name}'")
+        # identity of the weights (None if features must not be cached e.g. untrained network)
+        self.checkpoint_id = self.extractor.checkpoint_id
+
+        if quantize is None:
+            quantize = self.config.get('quantize', False)
+        self.quantize = quantize
+        if self.quantize:
+            print(f"Using dynamic int8 quantized '{model_name}'...")
+            self.extractor.model = quantize_dynamic(self.extractor.model)
+            if self.checkpoint_id is not None:
+                # quantized features are stored separately from the float ones
+                self.checkpoint_id = {'checkpoint': self.checkpoint_id, 'quantize': 'dynamic_int8'}
 
         for i in range(self.num_layers):
             self.layers.append(self.config['layers'][i]['layer_name'])
@@ -72,6 +99,23 @@ class FeatureExtractor():
             # self.bin_widths.append(self.config['layers'][i]['bin_width'])
             # self.offsets.append(self.config['layers'][i]['offset'])
 
+        # seq2seq networks run the encoder only (plus one decoder step if decoder 
+        # layers are configured), 'generate: True' in config restores full decoding.
+        if hasattr(self.extractor, 'decoder_step'):
+            self.extractor.decoder_step = any('decoder' in layer for layer in self.layers)
+            self.extractor.generate = self.config.get('generate', False)
+
+        # lengths (along time) of the inputs in a batch, set only during 'translate_batch'
+        self.lengths = None
+        # layers yet to be captured in the current pass, forward pass is 
+        # stopped after the last of these (None runs the whole network)
+        self.pending = None
+        self.supports_batching = hasattr(self.extractor, 'batch_fwd_pass')
+        # batched features equal to the single input features (see 'translate_batch')
+        self.exact_batching = self.supports_batching and getattr(self.extractor, 'exact_batching', True)
+        if self.supports_batching:
+            self.create_length_hooks()
+
         # Register fwd hooks for the given layers
         for layer_name in self.layers:
             layer = dict([*self.extractor.model.named_modules()])[layer_name]
@@ -80,17 +124,56 @@ class FeatureExtractor():
             
     def create_hooks(self):
         def fn(layer, _, output):
-            if 'rnn' in layer.__name__:
-               output = output[0].data
-                # output = output[1][0][1].squeeze()  # reading the 2nd half of data (only backward RNNs)
+            if self.lengths is not None:
+                # batched pass: keep batch dim, unpadded by 'translate_batch'
+                self.features[layer.__name__] = (output, self.lengths)
             else:
-                output = output.squeeze()
-                if 'conv' in layer.__name__:
-                    if output.ndim > 2:
-                        output = output.reshape(output.shape[0]*output.shape[1], -1)
-                    output = output.transpose(0,1)
-            self.features[layer.__name__] = output
+                self.features[layer.__name__] = self.format_output(layer.__name__, output)
+            if self.pending is not None:
+                self.pending.discard(layer.__name__)
+                if not self.pending:
+                    raise StopForward()
         return fn
+
+    def format_output(self, layer_name, output):
+        """Returns layer output of a single input as (time, dim) features."""
+        if 'rnn' in layer_name:
+           output = output[0].data
+            # output = output[1][0][1].squeeze()  # reading the 2nd half of data (only backward RNNs)
+        else:
+            output = output.squeeze()
+            if 'conv' in layer_name:
+                if output.ndim > 2:
+                    output = output.reshape(output.shape[0]*output.shape[1], -1)
+                output = output.transpose(0,1)
+        return output
+
+    def create_length_hooks(self):
+        """Registers hooks that track lengths of the batched inputs through
+        1d conv, pooling and padding modules (conv arithmetic), inputs of these
+        modules are zeroed beyond the valid length, so each input sees the 
+        same zero-padding as in the single input pass.
+        Modules under 'length_preserving' prefixes of the extractor are 
+        masked but do not update lengths (e.g. conv positional embeddings).
+        """
+        length_preserving = tuple(getattr(self.extractor, 'length_preserving', []))
+        def mask_input(module, inputs):
+            x = inputs[0]
+            if self.lengths is None or x.shape[0] != self.lengths.shape[0]:
+                return None
+            valid = torch.arange(x.shape[-1]) < self.lengths[:, None]
+            valid = valid.reshape(x.shape[:1] + (1,)*(x.ndim - 2) + x.shape[-1:])
+            return (x * valid.to(x.device, x.dtype),) + tuple(inputs[1:])
+        def update_lengths(module, _, output):
+            if self.lengths is not None:
+                self.lengths = output_lengths(module, self.lengths)
+
+        for name, module in self.extractor.model.named_modules():
+            if output_lengths(module, torch.zeros(1, dtype=torch.int64)) is None:
+                continue
+            module.register_forward_pre_hook(mask_input)
+            if not (length_preserving and name.startswith(length_preserving)):
+                module.register_forward_hook(update_lengths)
     
     def get_layer_index(self, layer_id):
         """Returns index for the layer_id (assigned in model specific config file),
@@ -125,24 +208,137 @@ class FeatureExtractor():
         offset = self.offsets[layer]
         return def_w, offset
 
-    def translate(self, aud, grad=False):
-        if grad:
-            input = self.extractor.fwd_pass_tensor(aud)
+    def start_pass(self, layers=None):
+        """Sets layers to be captured in the next forward pass, network is run
+        only up to the deepest of these.
+        
+        Args:
+            layers (list): layer indices, Default: all configured layers.
+        """
+        self.features.clear()
+        if layers is None:
+            self.pending = set(self.layers)
         else:
-            with torch.no_grad():
-                input = self.extractor.fwd_pass(aud)
+            self.pending = set(self.layers[j] for j in layers)
+
+    def translate(self, aud, grad=False, layers=None):
+        """Forward passes 'aud' through the network up to the deepest of 'layers'
+        (layer indices, Default: all configured layers), rest of the network (and
+        its graph, for grad=True) is not computed. Use 'get_features' afterwards.
+
+        Returns:
+            output of 'fwd_pass', None if the pass was stopped early.
+        """
+        self.start_pass(layers)
+        try:
+            if grad:
+                input = self.extractor.fwd_pass_tensor(aud)
+            else:
+                with torch.no_grad():
+                    input = self.extractor.fwd_pass(aud)
+        except StopForward:
+            input = None
+        finally:
+            self.pending = None
         return input
 
+    def translate_batch(self, auds):
+        """
+        Forward passes a batch of audio inputs (zero-padded to the longest) 
+        in a single pass, and unpads features of each input to the shapes 
+        given by the single input path ('translate' and 'get_features').
+
+        Note: for networks normalizing over time (e.g. group norm in 'wave2vec2'
+            and 'wave2vec') or attending over padded frames, batched features 
+            are close to (but not exactly equal to) the single input features,
+            these extractors set 'exact_batching = False' (such features are
+            not written to the feature store).
+
+        Args:
+            auds (list): 'wav' inputs of shape (t,), preferably of similar lengths.
+
+        Returns:
+            list: features (list of (time, dim) for all layers) for each input.
+        """
+        if not self.supports_batching:
+            raise NotImplementedError("Batched forward pass is not supported for this network.")
+        self.lengths = torch.tensor([aud.shape[0] for aud in auds], dtype=torch.int64)
+        self.start_pass()
+        try:
+            try:
+                with torch.no_grad():
+                    self.extractor.batch_fwd_pass(auds)
+            except StopForward:
+                pass
+            batch_features = [[None]*self.num_layers for _ in auds]
+            for j, layer in enumerate(self.layers):
+                output, lengths = self.features[layer]
+                for b, length in enumerate(lengths.tolist()):
+                    if 'conv' in layer:
+                        output_b = output[b:b+1, ..., :length]
+                    else:
+                        output_b = output[b:b+1, :length]
+                    batch_features[b][j] = self.format_output(layer, output_b)
+        finally:
+            self.lengths = None
+            self.pending = None
+        return batch_features
+
+
+def output_lengths(module, lengths):
+    """Returns lengths (along time) at the output of a 1d conv, pooling or 
+    padding 'module' for input 'lengths', None for any other module."""
+    if isinstance(module, (nn.Conv1d, nn.MaxPool1d, nn.AvgPool1d)):
+        first = lambda x: x[0] if isinstance(x, tuple) else x
+        kernel_size, stride = first(module.kernel_size), first(module.stride)
+        dilation = first(getattr(module, 'dilation', 1))
+        padding = first(module.padding)
+        if padding == 'same':
+            return lengths
+        if padding == 'valid':
+            padding = 0
+        return (lengths + 2*padding - dilation*(kernel_size - 1) - 1)//stride + 1
+    if isinstance(module, (nn.ConstantPad1d, nn.ReplicationPad1d, nn.ReflectionPad1d)):
+        return lengths + module.padding[0] + module.padding[1]
+    if hasattr(module, 'pad_left') and hasattr(module, 'pad_right'):
+        # fairseq ZeroPad1d
+        return lengths + module.pad_left + module.pad_right
+    return None
+
+def pad_batch(auds):
+    """Returns (batch, max_t) tensor of 'wav' inputs, zero-padded at the end."""
+    batch = torch.zeros(len(auds), max(aud.shape[0] for aud in auds), dtype=torch.float32)
+    for b, aud in enumerate(auds):
+        batch[b, :aud.shape[0]] = torch.as_tensor(aud, dtype=torch.float32)
+    return batch
+
+def encoder_pass(model, input_features, decoder_step=False):
+    """Forward passes input features through encoder of a seq2seq 'model' (instead 
+    of autoregressive decoding), with a single decoder step (start token) if 
+    'decoder_step' is True, i.e. when hooks are registered on decoder layers."""
+    if decoder_step:
+        decoder_input_ids = torch.tensor([[model.config.decoder_start_token_id]])
+        return model(input_features, decoder_input_ids=decoder_input_ids)
+    return model.get_encoder()(input_features)
+
+def hub_checkpoint_id(model):
+    """Returns identity of weights loaded from huggingface hub [name, revision]."""
+    return [model.config._name_or_path, getattr(model.config, '_commit_hash', None)]
+
 
 class FeatureExtractorW2L():
     def __init__(self, checkpoint, pretrained):
+        from wav2letter.models import Wav2LetterRF
         if pretrained:		
             self.model = Wav2LetterRF.load_from_checkpoint(checkpoint)
             print(f"Loading from checkpoint: {checkpoint}")
+            self.checkpoint_id = checkpoint_fingerprint(checkpoint)
     
         else:
             self.model = Wav2LetterRF()
             print(f"Creating untrained network...!")
+            # random weights, features can not be reused...
+            self.checkpoint_id = None
 
     def fwd_pass(self, aud):
         """
@@ -161,6 +357,14 @@ class FeatureExtractorW2L():
         self.model.eval()
         out = self.model(input)
         return input
+
+    def batch_fwd_pass(self, auds):
+        """Forward passes a batch of 'wav' inputs (list of (t,)) zero-padded
+        to the longest, features are captured in the 'self.features' dict."""
+        input = pad_batch(auds)
+        self.model.eval()
+        out = self.model(input)
+        return input
     
     def fwd_pass_tensor(self, aud):
         """
@@ -179,8 +383,17 @@ class FeatureExtractorW2L():
 
 class FeatureExtractorW2V2():
     def __init__(self):
+        from transformers import Wav2Vec2Processor, Wav2Vec2ForCTC
         self.processor = Wav2Vec2Processor.from_pretrained("facebook/wav2vec2-base-960h")
         self.model = Wav2Vec2ForCTC.from_pretrained("facebook/wav2vec2-base-960h")
+        self.checkpoint_id = hub_checkpoint_id(self.model)
+        # conv positional embedding (with same-padding) keeps lengths unchanged
+        self.length_preserving = ['wav2vec2.encoder.pos_conv_embed']
+        # checkpoints with layer norm feature encoders take attention mask of padded
+        # batches, group norm checkpoints (e.g. base-960h) are used without it
+        self.use_attention_mask = self.processor.feature_extractor.return_attention_mask
+        # group norm (and attention) over padded frames...
+        self.exact_batching = False
         # self.model = model 
         ########################## NEED TO MAKE THIS CONSISTENT>>>##################
     def fwd_pass(self, aud):
@@ -206,6 +419,21 @@ class FeatureExtractorW2V2():
         # self.model.eval()
         # out = self.model(input)
         return input
+
+    def batch_fwd_pass(self, auds):
+        """Forward passes a batch of 'wav' inputs (list of (t,)), each input is 
+        normalized by the processor and zero-padded to the longest."""
+        input = [aud.astype(np.float64) for aud in auds]
+        inputs = self.processor(
+            input, sampling_rate=16000, return_tensors="pt", padding="longest",
+            return_attention_mask=self.use_attention_mask
+            )
+        self.model.eval()
+        if self.use_attention_mask:
+            logits = self.model(inputs.input_values, attention_mask=inputs.attention_mask).logits
+        else:
+            logits = self.model(inputs.input_values).logits
+        return inputs.input_values
     
     def fwd_pass_tensor(self, aud_tensor):
         """
@@ -224,15 +452,28 @@ class FeatureExtractorW2V2():
 
 class FeatureExtractorS2T():
     def __init__(self):
+        from transformers import Speech2TextForConditionalGeneration, Speech2TextProcessor
         self.model = Speech2TextForConditionalGeneration.from_pretrained("facebook/s2t-large-librispeech-asr")
         self.processor = Speech2TextProcessor.from_pretrained("facebook/s2t-large-librispeech-asr")
+        self.checkpoint_id = hub_checkpoint_id(self.model)
+        # log-mel input features, computed once per input (see 'frontend_cache')
+        self.frontend = get_frontend_cache('log_mel', {'processor': "facebook/s2t-large-librispeech-asr"})
+        # set by FeatureExtractor as per configured layers (see 'encoder_pass')
+        self.decoder_step = False
+        self.generate = False
                 
+    def get_input_features(self, aud):
+        """Returns (1, t, 80) log-mel input features of audio input."""
+        return self.processor(aud,padding=True, sampling_rate=16000, return_tensors="pt").input_features
+
     def fwd_pass(self, aud):
-        input_features = self.processor(aud,padding=True, sampling_rate=16000, return_tensors="pt").input_features
+        input_features = torch.as_tensor(self.frontend.get(aud, self.get_input_features))
         # with torch.no_grad():
         self.model.eval()
-        generated_ids = self.model.generate(input_features, max_new_tokens=200)
-        return generated_ids
+        if self.generate:
+            generated_ids = self.model.generate(input_features, max_new_tokens=200)
+            return generated_ids
+        return encoder_pass(self.model, input_features, self.decoder_step)
 
     def fwd_pass_tensor(self, aud_spect):
         """
@@ -255,31 +496,54 @@ class FeatureExtractorS2T():
     
 class FeatureExtractorWhisper():
     def __init__(self):
+        from transformers import AutoProcessor, WhisperForConditionalGeneration
         self.processor = AutoProcessor.from_pretrained("openai/whisper-tiny.en")
         self.model = WhisperForConditionalGeneration.from_pretrained("openai/whisper-tiny.en")
+        self.checkpoint_id = hub_checkpoint_id(self.model)
+        # log-mel input features, computed once per input (see 'frontend_cache')
+        self.frontend = get_frontend_cache('log_mel', {'processor': "openai/whisper-tiny.en"})
+        # set by FeatureExtractor as per configured layers (see 'encoder_pass')
+        self.decoder_step = False
+        self.generate = False
 				
+    def get_input_features(self, aud):
+        """Returns (1, 80, 3000) log-mel input features of audio input."""
+        return self.processor(aud, sampling_rate=16000, return_tensors="pt").input_features
+
     def fwd_pass(self, aud):
-        input_features = self.processor(aud, sampling_rate=16000, return_tensors="pt").input_features
+        input_features = torch.as_tensor(self.frontend.get(aud, self.get_input_features))
         # with torch.no_grad():
         self.model.eval()
-        generated_ids = self.model.generate(inputs=input_features, max_new_tokens=400)
-            # transcription = processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
-        return generated_ids
+        if self.generate:
+            generated_ids = self.model.generate(inputs=input_features, max_new_tokens=400)
+                # transcription = processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
+            return generated_ids
+        return encoder_pass(self.model, input_features, self.decoder_step)
     
 class FeatureExtractorDeepSpeech2():
     def __init__(self, checkpoint):
+        from deepspeech_pytorch.model import DeepSpeech
+        import deepspeech_pytorch.loader.data_loader as data_loader
+        from deepspeech_pytorch.configs.train_config import SpectConfig
 
         audio_config = SpectConfig()
         self.parser = data_loader.AudioParser(audio_config, normalize=True)
         self.model = DeepSpeech.load_from_checkpoint(checkpoint_path=checkpoint)
+        self.checkpoint_id = checkpoint_fingerprint(checkpoint)
+        # spectrograms, computed once per input (see 'frontend_cache')
+        self.frontend = get_frontend_cache(
+            'deepspeech_spectrogram', {'spect_config': repr(audio_config), 'normalize': True}
+        )
         # self.processor = AutoProcessor.from_pretrained("openai/whisper-tiny.en")
         # self.model = WhisperForConditionalGeneration.from_pretrained("openai/whisper-tiny.en")
 	
-    def get_spectrogram(self, aud):
-        """Gives spectrogram of audio input."""
+    def get_spectrogram(self, aud, cache=True):
+        """Gives spectrogram of audio input (cached per input, unless cache=False)."""
         if torch.is_tensor(aud):
             aud = aud.cpu().numpy()
-        return self.parser.compute_spectrogram(aud)
+        if not cache:
+            return self.parser.compute_spectrogram(aud)
+        return torch.as_tensor(self.frontend.get(aud, self.parser.compute_spectrogram))
 
     def fwd_pass(self, aud):
         
@@ -311,10 +575,14 @@ class FeatureExtractorDeepSpeech2():
     
 class FeatureExtractorW2V():
     def __init__(self, checkpoint):
+        import fairseq
 
         # cp_path = os.path.join(pretrained_dir, 'wave2vec', 'wav2vec_large.pt')
         model, cfg, task = fairseq.checkpoint_utils.load_model_ensemble_and_task([checkpoint])
         self.model = model[0]
+        self.checkpoint_id = checkpoint_fingerprint(checkpoint)
+        # group norm over padded frames...
+        self.exact_batching = False
 				
     def fwd_pass(self, aud):
         aud_tensor = torch.tensor(aud, dtype=torch.float32)
@@ -325,6 +593,16 @@ class FeatureExtractorW2V():
             c = self.model.feature_aggregator(z)
         return c
 
+    def batch_fwd_pass(self, auds):
+        """Forward passes a batch of 'wav' inputs (list of (t,)) zero-padded
+        to the longest, features are captured in the 'self.features' dict."""
+        aud_tensor = pad_batch(auds)
+        self.model.eval()
+        with torch.no_grad():
+            z = self.model.feature_extractor(aud_tensor)
+            c = self.model.feature_aggregator(z)
+        return c
+
     def fwd_pass_tensor(self, aud_tensor):
         """
         Forward passes audio input through the model and captures 
@@ -0,0 +1,76 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+# local
+from auditory_cortex import cache_dir
+
+# sub-directory (inside cache_dir) holding the feature stores
+FEATURES_CACHE = 'features'
+
+
+def checkpoint_fingerprint(checkpoint):
+    """Returns identity of a checkpoint file [path, size, mtime_ns],
+    used to tell if features extracted with the checkpoint are stale."""
+    stat = os.stat(checkpoint)
+    return [os.path.abspath(checkpoint), stat.st_size, stat.st_mtime_ns]
+
+
+class FeatureStore:
+    """Persistent store of raw (un-resampled) features of a network, one .npy
+    file per (layer, sentence) under cache_dir/features/<model_name>/<key>/<layer>/.
+    Store key is content hash of model name, checkpoint identity, 'audio_zeropad'
+    and padding duration, layers are stored (and looked up) by layer name,
+    so changing the configured layers only extracts the new layers.
+    Stored features are memory-mapped when loaded.
+
+    Args:
+        model_name (str): name of the network (as in FeatureExtractor).
+        checkpoint_id: JSON serializable identity of the weights
+            (e.g. 'checkpoint_fingerprint' or hub model name).
+        audio_zeropad (bool): audio zero-padded before extracting features.
+        padding_duration (float): duration (sec) of the zero-padding.
+    """
+    def __init__(self, model_name, checkpoint_id, audio_zeropad=False, padding_duration=0):
+        self.meta = {
+            'model_name': model_name,
+            'checkpoint': checkpoint_id,
+            'audio_zeropad': bool(audio_zeropad),
+            'padding_duration': float(padding_duration) if audio_zeropad else 0.0,
+        }
+        key = hashlib.sha1(json.dumps(self.meta, sort_keys=True).encode()).hexdigest()[:16]
+        self.path = os.path.join(cache_dir, FEATURES_CACHE, model_name, key)
+        meta_file = os.path.join(self.path, 'meta.json')
+        if not os.path.isfile(meta_file):
+            os.makedirs(self.path, exist_ok=True)
+            with open(meta_file, 'w') as f:
+                json.dump(self.meta, f, indent=2)
+
+    def file(self, layer, sent):
+        """Returns path of features file for (layer, sent)."""
+        return os.path.join(self.path, layer, f'{int(sent)}.npy')
+
+    def contains(self, layers, sent):
+        """Returns True if features of all 'layers' are stored for 'sent'."""
+        return all(os.path.isfile(self.file(layer, sent)) for layer in layers)
+
+    def missing(self, layers, sents):
+        """Returns sents that have features of any of the 'layers' missing."""
+        return [sent for sent in sents if not self.contains(layers, sent)]
+
+    def load(self, layer, sent):
+        """Returns (memory-mapped) features of (layer, sent)."""
+        return np.load(self.file(layer, sent), mmap_mode='r')
+
+    def save(self, layer, sent, features):
+        """Writes features of (layer, sent) to the store and returns them as ndarray."""
+        if not isinstance(features, np.ndarray):
+            features = features.detach().cpu().numpy()
+        path = self.file(layer, sent)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, features)
+        os.replace(tmp_path, path)
+        return features
@@ -0,0 +1,117 @@
+import os
+import json
+import hashlib
+import numpy as np
+from collections import OrderedDict
+
+# local
+from auditory_cortex import cache_dir
+
+# sub-directory (inside cache_dir) holding the front-end caches
+FRONTEND_CACHE = 'frontends'
+
+# process-wide caches, one per (front-end, parameters)
+_frontend_caches = {}
+
+
+def get_frontend_cache(name, params=None):
+    """Returns the process-wide cache of front-end 'name' with 'params',
+    creates it on first use."""
+    key = (name, json.dumps(params, sort_keys=True))
+    if key not in _frontend_caches:
+        _frontend_caches[key] = FrontEndCache(name, params)
+    return _frontend_caches[key]
+
+def waveform_digest(waveform):
+    """Returns content hash of waveform (ndarray or tensor), including dtype and shape."""
+    if hasattr(waveform, 'detach'):
+        waveform = waveform.detach().cpu().numpy()
+    waveform = np.ascontiguousarray(waveform)
+    digest = hashlib.sha1(f"{waveform.dtype.str}-{waveform.shape}".encode())
+    digest.update(waveform.data)
+    return digest.hexdigest()
+
+
+class FrontEndCache:
+    """Cache of input spectrograms of a front-end (e.g. log-mel of a hugging-face
+    processor, kaldi fbank, DeepSpeech spectrogram), keyed by (front-end name,
+    parameters, waveform content). Outputs are computed once, kept in memory
+    (most recent, up to 'max_bytes') and on disk, one .npy file per waveform under
+    cache_dir/frontends/<name>/<key>/, key is content hash of the parameters.
+    Outputs are only computed (and kept in memory) if the cache directory can
+    not be written.
+
+    Args:
+        name (str): name of the front-end.
+        params (dict): JSON serializable parameters of the front-end.
+        max_bytes (int): memory of the outputs kept in memory (least recently 
+            used are dropped), per process.
+    """
+    def __init__(self, name, params=None, max_bytes=256*2**20):
+        self.meta = {'name': name, 'params': params}
+        key = hashlib.sha1(json.dumps(self.meta, sort_keys=True).encode()).hexdigest()[:16]
+        self.path = os.path.join(cache_dir, FRONTEND_CACHE, name, key)
+        self.max_bytes = max_bytes
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.writable = True
+        meta_file = os.path.join(self.path, 'meta.json')
+        if not os.path.isfile(meta_file):
+            try:
+                os.makedirs(self.path, exist_ok=True)
+                self.write_file(meta_file, lambda f: f.write(json.dumps(self.meta, indent=2).encode()))
+            except OSError as err:
+                self.not_writable(err)
+
+    def not_writable(self, err):
+        """Disables writing to the cache directory (outputs are computed only)."""
+        self.writable = False
+        print(f"(front-end '{self.meta['name']}' not cached on disk: {err}) ")
+
+    def write_file(self, path, write):
+        """Writes 'path' through a temporary file (by 'write(f)') renamed in place."""
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def file(self, digest):
+        """Returns path of the cached output for waveform 'digest'."""
+        return os.path.join(self.path, f'{digest}.npy')
+
+    def get(self, waveform, compute):
+        """Returns front-end output (as ndarray) for 'waveform', 'compute(waveform)'
+        is called only if not cached. Waveforms requiring grad are not cached.
+        Returned array is a copy, safe to be modified by the caller."""
+        if getattr(waveform, 'requires_grad', False):
+            return compute(waveform)
+        digest = waveform_digest(waveform)
+        if digest in self.memory:
+            self.memory.move_to_end(digest)
+            return self.memory[digest].copy()
+
+        path = self.file(digest)
+        if os.path.isfile(path):
+            output = np.load(path)
+        else:
+            output = compute(waveform)
+            if hasattr(output, 'detach'):
+                output = output.detach().cpu().numpy()
+            output = np.asarray(output)
+            if self.writable:
+                try:
+                    self.write_file(path, lambda f: np.save(f, output))
+                except OSError as err:
+                    self.not_writable(err)
+
+        self.memory[digest] = output
+        self.memory_bytes += output.nbytes
+        while self.memory_bytes > self.max_bytes and len(self.memory) > 1:
+            _, dropped = self.memory.popitem(last=False)
+            self.memory_bytes -= dropped.nbytes
+        return output.copy()
@@ -1,26 +1,89 @@
 import gc
 import os
 import time
+import tempfile
+import multiprocessing
 import yaml
 import torch
 import numpy as np
-import pandas as pd
-from scipy import linalg, signal
-import matplotlib.pyplot as plt
-
-from sklearn.decomposition import PCA
+from scipy import linalg
 
 # local
-from auditory_cortex import config
+from auditory_cortex import config, lazy_import, cache_dir
 import auditory_cortex.utils as utils
-from auditory_cortex.dataset import NeuralData
+from auditory_cortex.dataset import NeuralData, SentenceBuffer, get_stimulus_bank, load_normalizer
 from auditory_cortex.feature_extractors import FeatureExtractor
+from auditory_cortex.feature_store import FeatureStore
+from auditory_cortex.resampling import Resampler
+from auditory_cortex.sentence_stats import FeatureStatistics, SentenceStatistics
+
+# imported on first use...
+pd = lazy_import('pandas')
 
 # import GPU specific packages...
 from auditory_cortex import hpc_cluster
 if hpc_cluster:
     import cupy as cp
 
+# sub-directory (inside cache_dir) holding memory-mapped resampled features
+SAMPLED_FEATURES_DIR = 'sampled_features'
+
+# state of feature extraction worker process (see 'init_extraction_worker')
+_extraction_worker = {}
+
+
+def audio_input(dataset, sent, padding_samples=0):
+    """Returns audio of 'sent', zero-padded at the start by 'padding_samples'."""
+    if padding_samples:
+        return np.concatenate([np.zeros(padding_samples), dataset.audio(sent)], axis=0)
+    return dataset.audio(sent)
+
+def translate_batch(extractor, audio_inputs):
+    """Returns features (list of all layers) for each of the audio inputs,
+    (batched forward pass for more than one input)."""
+    if len(audio_inputs) > 1:
+        return extractor.translate_batch(audio_inputs)
+    extractor.translate(audio_inputs[0], grad = False)
+    return [[extractor.get_features(j) for j in range(extractor.num_layers)]]
+
+def available_cpus():
+    """Returns number of CPUs this process may run on (respects affinity
+    masks and cluster CPU limits, where supported)."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def get_feature_dtype(dtype):
+    """Returns numpy float dtype for storage of features (see 'Regression'),
+    raises ValueError for other dtypes (e.g. 'bfloat16' has no numpy dtype)."""
+    try:
+        float_dtype = np.dtype(dtype)
+    except TypeError:
+        float_dtype = None
+    if float_dtype is None or float_dtype.kind != 'f':
+        raise ValueError(
+            f"Feature dtype: '{dtype}' not supported, use one of 'float16', 'float32' or 'float64'."
+        )
+    return float_dtype
+
+def init_extraction_worker(model_name, data_dir, num_threads, padding_samples, quantize=None):
+    """Initializer of extraction worker processes, creates the feature extractor
+    once per worker and caps its intra-op threads (to not oversubscribe cores)."""
+    torch.set_num_threads(num_threads)
+    _extraction_worker['extractor'] = FeatureExtractor(model_name, quantize=quantize)
+    _extraction_worker['dataset'] = get_stimulus_bank(data_dir)
+    _extraction_worker['padding_samples'] = padding_samples
+
+def extract_in_worker(batch):
+    """Returns features (list of all layers, as ndarray) for each sent in 'batch',
+    runs in an extraction worker process."""
+    dataset = _extraction_worker['dataset']
+    audio_inputs = [
+        audio_input(dataset, sent, _extraction_worker['padding_samples']) for sent in batch
+    ]
+    batch_features = translate_batch(_extraction_worker['extractor'], audio_inputs)
+    return [[np.asarray(feats) for feats in sent_features] for sent_features in batch_features]
+
 
 class Regression():
     def __init__(
@@ -28,25 +91,78 @@ class Regression():
             model_name = 'speech2text',
             load_features = True,
             delay_features = False,
-            audio_zeropad = False
+            audio_zeropad = False,
+            cache_features = True,
+            batch_size = 1,
+            num_workers = 0,
+            feature_dtype = None,
+            memmap_features = False,
+            quantize = None,
+            sentence_stats = False
         ):
         """
+        Args:
+            cache_features (bool): reuse raw features from the feature store 
+                (see 'FeatureStore'), extracting only the missing sentences.
+            batch_size (int): number of sentences (of similar lengths) per 
+                forward pass, for networks supporting batched extraction,
+                features of networks not batched exactly (e.g. 'wave2vec2') are not cached.
+            num_workers (int): number of worker processes for feature extraction,
+                each worker loads its own copy of the network (0 extracts in 
+                this process), see 'extraction_pool'.
+            feature_dtype (str): opt-in storage dtype of raw and resampled 
+                features, one of 'float16', 'float32' or 'float64' (numpy float dtypes),
+                'float16' halves the memory of float32 features, features are 
+                upcast only inside the regression solve (see 'utils.reg').
+                Default: None, features are kept as extracted/resampled.
+                Features read from the feature store stay memory-mapped as stored.
+            memmap_features (bool): stream resampled features (one sentence at 
+                a time) into memory-mapped (disk-backed) per-layer buffers, 
+                instead of keeping them in memory (see 'stream_features').
+            quantize (bool): dynamic int8 quantized (CPU) inference of the network,
+                Default: None, as set by 'quantize' in the network's config.
+            sentence_stats (bool): cross-validate lmbdas from per-sentence sufficient
+                statistics (see 'SentenceStatistics'), folds are sums of the
+                statistics instead of re-concatenated features and spikes.
+                Not used with PCA, memory grows as layers x d x (d + channels) per sent.
         """
         self.data_dir = config['neural_data_dir']
 
-        self.dataset = NeuralData(self.data_dir, '180810')
+        # stimulus details (audio, durations), shared with all the sessions
+        self.dataset = get_stimulus_bank(self.data_dir)
         self.sents = np.arange(1,500)
         self.spike_datasets = {}
+        # neural data of a single session (see 'neural_data'), loaded when first used
+        self._neural_data = None
 
         print(f"Creating regression obj for: '{model_name}'")
         # self.model = model
-        self.model_extractor = FeatureExtractor(model_name)
+        self.model_extractor = FeatureExtractor(model_name, quantize=quantize)
         self.model_name = model_name
         self.layers = self.model_extractor.layers
         self.layer_ids = self.model_extractor.layer_ids
         self.receptive_fields = self.model_extractor.receptive_fields
         self.features_delay_trim = None
         self.audio_padding_duration = 0
+        self.cache_features = cache_features
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.feature_dtype = None if feature_dtype is None else get_feature_dtype(feature_dtype)
+        self.memmap_features = memmap_features
+        # temporary directory of memory-mapped features (see 'stream_features')
+        self.buffers_dir = None
+        # resampling all layers of a sentence at once (exact FFT path, see 'Resampler')
+        self.resampler = Resampler()
+        # raw features kept for resampling at other bin widths (see 'get_raw_features')
+        self.raw_features = None
+        self.raw_features_key = None
+        # per-sentence sufficient statistics (see 'get_sentence_stats')
+        self.sentence_stats = sentence_stats
+        self.stats = None
+        self.stats_key = None
+        # X^T X of the loaded features, shared by all sessions and delays
+        self.feature_stats = None
+        self.feature_stats_key = None
         self.use_pca = self.model_extractor.use_pca
         if self.use_pca:
             self.pca_comps = self.model_extractor.pca_comps
@@ -59,6 +175,14 @@ class Regression():
         if load_features:
             self.load_features(delay_features=delay_features, audio_zeropad=audio_zeropad)
 
+    @property
+    def neural_data(self):
+        """Neural data of session '180810' (loaded when first used), for the
+        single-session methods (signal power, spike counts and channels)."""
+        if self._neural_data is None:
+            self._neural_data = NeuralData(self.data_dir, '180810')
+        return self._neural_data
+
     def get_layer_index(self, layer_id):
         """Returns layer index for layer ID (defined in config).
         Calls instance method of 'self.model_extractor'
@@ -72,6 +196,50 @@ class Regression():
         print(f"Loading ANN features at bin-width: {bin_width}")
         # if sents is None:
         #     sents = self.sents
+        self.set_feature_delays(bin_width, delay_features, audio_zeropad)
+        # statistics of previously loaded features are stale now...
+        self.stats = None
+        self.stats_key = None
+        self.feature_stats = None
+        self.feature_stats_key = None
+        if self.memmap_features:
+            self.sampled_features = self.stream_features(
+                bin_width, delay_features=delay_features, audio_zeropad=audio_zeropad
+            )
+            if not self.use_pca:
+                self.feature_dims = self.sampled_features[0].data.shape[1]
+            return
+        raw_features = self.get_raw_features(audio_zeropad=audio_zeropad)
+        if not self.use_pca:
+            self.feature_dims = raw_features[0][1].shape[1]
+        self.sampled_features = self.resample(raw_features, bin_width, delay_features=delay_features)
+        # self.features = self.unroll_features(sents = sents, numpy=numpy, return_dict=True)
+
+    def use_resampled(self, bin_width, feature_set, delay_features=False):
+        """Makes features resampled to 'bin_width' by 'resample_to' the current
+        features, same as 'load_features' at 'bin_width' (without audio padding).
+
+        Args:
+            bin_width (int): bin width (ms) of 'feature_set'.
+            feature_set (tuple): (features, sent_sections) as returned by 'resample_to'.
+            delay_features (bool): as passed to 'resample_to'.
+        """
+        print(f"Using ANN features at bin-width: {bin_width}")
+        self.set_feature_delays(bin_width, delay_features)
+        # statistics of previously loaded features are stale now...
+        self.stats = None
+        self.stats_key = None
+        self.feature_stats = None
+        self.feature_stats_key = None
+        features, sent_sections = feature_set
+        self.sampled_features = features
+        self.sent_sections = sent_sections
+        if not self.use_pca:
+            self.feature_dims = next(iter(features[0].values())).shape[1]
+
+    def set_feature_delays(self, bin_width, delay_features=False, audio_zeropad=False):
+        """Sets layer-wise feature delays (and spikes trimming or audio padding)
+        for features at 'bin_width'."""
         if delay_features:
             print("Features Delay requested:")
             print("- Delaying features by half of RF for each layer")
@@ -99,11 +267,8 @@ class Regression():
         elif audio_zeropad:
             ...
             raise AttributeError(f"Invalid arguments: Features delay must for Audio zero-padding!!!")
-        raw_features = self.extract_features(audio_zeropad=audio_zeropad)
-        if not self.use_pca:
-            self.feature_dims = raw_features[0][1].shape[1]
-        self.sampled_features = self.resample(raw_features, bin_width, delay_features=delay_features)
-        # self.features = self.unroll_features(sents = sents, numpy=numpy, return_dict=True)
+        else:
+            self.audio_padding_duration = 0
 
     def unroll_features(self, sents = None, numpy=True, return_dict=False, train_pca=False,
                         layers=None, third=None):
@@ -125,12 +290,20 @@ class Regression():
         # sampled_features = self.resample(bin_width)
         feats = {}
         for j, l in enumerate(self.layers):
-            if third is None:
+            if isinstance(self.sampled_features[j], SentenceBuffer):
+                # single gather of the slices (read from disk for memory-mapped buffers)
+                start, stop = 0, None
+                if third is not None:
+                    sections = np.array([self.sent_sections[sent] for sent in sents]).reshape(-1, 4)
+                    start, stop = sections[:, third-1], sections[:, third]
+                feats[j] = self.sampled_features[j].gather(sents, start, stop)
+            elif third is None:
                 feats[j] = np.concatenate([self.sampled_features[j][sent] for sent in sents], axis=0)
             else:
                 feats[j] = np.concatenate([self.sampled_features[j][sent][self.sent_sections[sent][third-1]:self.sent_sections[sent][third]] for sent in sents], axis=0)
             if self.use_pca:
                 if train_pca:
+                    from sklearn.decomposition import PCA
                     self.pca[j] = PCA(n_components=self.pca_comps)
                     feats[j] = self.pca[j].fit_transform(feats[j])
                 else:
@@ -141,35 +314,173 @@ class Regression():
             feats = np.stack([feats[i] for i in layers], axis=0)
         return feats
 
-    def extract_features(self, audio_zeropad=False):
+    def extract_features(self, audio_zeropad=False, sents=None, batch_size=None, num_workers=None):
         """
-        Returns all layer features for given 'sents'
+        Returns all layer features for given 'sents', features already in the 
+        feature store are loaded (memory-mapped), only missing sentences are
+        passed through the network (and added to the store).
 
         Args:
+            audio_zeropad (bool): zero-pad audio before extracting features.
             sents (list, optional): List of sentence ID's to get the features for. 
+            batch_size (int): sentences per forward pass, Default: self.batch_size.
+                Sentences are sorted by length before batching.
+            num_workers (int): worker processes, Default: self.num_workers. 
+                Batches are sharded across workers, results are received 
+                (and written to the feature store) in order.
 
         Returns:
             List of dict: List index corresponds to layer number carrying 
                             dict of extracted features for all sentences. 
         """
-        sents = self.sents
+        if sents is None:
+            sents = self.sents
         features = [{} for _ in range(self.num_layers)]
+        for i, sent_features in self.iter_features(audio_zeropad, sents, batch_size, num_workers):
+            for j in range(self.num_layers):
+                features[j][i] = sent_features[j]
+
+        # keep sentences in the order requested...
+        return [{i: layer_features[i] for i in sents} for layer_features in features]
+
+    def iter_features(self, audio_zeropad=False, sents=None, batch_size=None, num_workers=None):
+        """
+        Yields (sent, features (list of all layers)) for given 'sents', one 
+        sentence at a time. Sentences in the feature store are yielded first
+        (memory-mapped), then the missing ones as they are extracted (see 
+        'extract_features' for the arguments).
+        """
+        if sents is None:
+            sents = self.sents
+        if batch_size is None:
+            batch_size = self.batch_size
+        if num_workers is None:
+            num_workers = self.num_workers
+        store = self.get_feature_store(audio_zeropad)
         # self.audio_padding_duration = 0 # incase of no padding, 
 
-        for x, i in enumerate(sents):
-            if audio_zeropad:
-                audio_input = np.concatenate([
-                        np.zeros(self.audio_padding_samples),
-                        self.dataset.audio(i)
-                    ], axis=0)
-            else:
-                audio_input = self.dataset.audio(i)
+        if store is None:
+            missing = list(sents)
+        else:
+            missing = store.missing(self.layers, sents)
+            stored = set(sents).difference(missing)
+            for i in sents:
+                if i in stored:
+                    yield i, [store.load(layer, i) for layer in self.layers]
+        batched = batch_size > 1 and self.model_extractor.supports_batching
+        if batched and store is not None and not self.model_extractor.exact_batching:
+            # stored features do not depend on batching (or on which sents were batched together)
+            print("Batched features are not exact for this network, these are not cached.")
+            store = None
+        if batched:
+            # group sentences of similar lengths, to minimize padding...
+            missing = sorted(missing, key=lambda i: self.dataset.audio(i).shape[0])
+            batches = [missing[x:x+batch_size] for x in range(0, len(missing), batch_size)]
+        else:
+            batches = [[i] for i in missing]
 
-            self.model_extractor.translate(audio_input, grad = False)
-            for j in range(self.num_layers):
-                features[j][i] = self.model_extractor.get_features(j)
+        if num_workers > 1 and len(batches) > 1:
+            pool = self.extraction_pool(num_workers, audio_zeropad)
+            results = pool.imap(extract_in_worker, batches)
+        else:
+            pool = None
+            results = (
+                translate_batch(self.model_extractor, [self.audio_input(i, audio_zeropad) for i in batch])
+                for batch in batches
+            )
+        try:
+            for batch, batch_features in zip(batches, results):
+                for i, sent_features in zip(batch, batch_features):
+                    if store is not None:
+                        sent_features = [
+                            store.save(layer, i, feats) for layer, feats in zip(self.layers, sent_features)
+                        ]
+                    yield i, [self.to_feature_dtype(feats) for feats in sent_features]
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    def audio_input(self, sent, audio_zeropad=False):
+        """Returns audio of 'sent' (zero-padded at the start if audio_zeropad)."""
+        padding_samples = self.audio_padding_samples if audio_zeropad else 0
+        return audio_input(self.dataset, sent, padding_samples)
+
+    def extraction_pool(self, num_workers, audio_zeropad=False):
+        """Returns pool of 'num_workers' feature extraction processes, available
+        cores are split evenly among workers (intra-op threads of torch).
+        Workers are spawned (fresh interpreters, no threads or CUDA state inherited
+        from this process), so the calling script must guard its entry point
+        with if __name__ == '__main__'."""
+        num_threads = max(1, available_cpus() // num_workers)
+        padding_samples = self.audio_padding_samples if audio_zeropad else 0
+        print(f"Extracting features with {num_workers} workers ({num_threads} threads each)...")
+        return multiprocessing.get_context('spawn').Pool(
+            num_workers, initializer=init_extraction_worker,
+            initargs=(
+                self.model_name, self.data_dir, num_threads, padding_samples,
+                self.model_extractor.quantize
+            )
+        )
+
+    def get_feature_store(self, audio_zeropad=False):
+        """Returns feature store for the network and audio padding, None if 
+        caching is off or weights have no stable identity (untrained network)."""
+        if not self.cache_features or self.model_extractor.checkpoint_id is None:
+            return None
+        return FeatureStore(
+            self.model_name, self.model_extractor.checkpoint_id,
+            audio_zeropad=audio_zeropad, padding_duration=self.audio_padding_duration
+        )
+
+    def get_raw_features(self, audio_zeropad=False):
+        """Returns raw (un-resampled) features of all sents, kept after the first
+        call, so changing bin width does not re-run the network (features from 
+        the feature store are memory-mapped, keeping them costs no memory). 
+        Features are extracted again if audio padding changes."""
+        key = (audio_zeropad, self.audio_padding_duration if audio_zeropad else 0)
+        if self.raw_features is None or self.raw_features_key != key:
+            self.raw_features = self.extract_features(audio_zeropad=audio_zeropad)
+            self.raw_features_key = key
+        return self.raw_features
+
+    def resample_to(self, bin_widths, delay_features=False, sents=None):
+        """
+        Resamples raw features to each of the 'bin_widths' in one pass over the 
+        sentences (raw features of a sentence are read once for all widths),
+        select one with 'use_resampled'. Features without audio padding only,
+        padding depends on the bin width (use 'load_features' per bin width).
+        Loaded features and audio padding settings are not changed.
 
-        return features
+        Args:
+            bin_widths (list): bin widths (ms) to resample to, only these are materialized.
+            delay_features (bool): delay each layer by half of its RF (at each bin width).
+            sents (list): sent ID's, Default: self.sents.
+
+        Returns:
+            dict: bin_width -> (features, sent_sections), features are list of dict 
+                (as returned by 'resample') and sent_sections are the matching 
+                boundaries of sent thirds.
+        """
+        if sents is None:
+            sents = self.sents
+        raw_features = self.get_raw_features()
+        feature_sets = {
+            bin_width: ([{} for _ in range(self.num_layers)], {}) for bin_width in bin_widths
+        }
+        layer_delays = {
+            bin_width: (np.array(self.receptive_fields)/(2.0*bin_width)).astype(int)
+            for bin_width in bin_widths
+        }
+        for sent in sents:
+            sent_features = [np.array(layer[sent]) for layer in raw_features]
+            for bin_width, (features, sent_sections) in feature_sets.items():
+                n = self.num_samples(sent, bin_width, sent_sections=sent_sections, padding_duration=0)
+                resampled = self.resample_sent(
+                    sent_features, n, delay_features, layer_delays=layer_delays[bin_width]
+                )
+                for j, feats in enumerate(resampled):
+                    features[j][sent] = feats
+        return feature_sets
 
     def resample(self, raw_features, bin_width, delay_features=False):
         """
@@ -184,29 +495,110 @@ class Regression():
         resampled_features = [{} for _ in range(len(self.layers))]
         self.sent_sections = {}
 
-        bin_width = bin_width/1000 # ms
         for sent in raw_features[0].keys():
-            # 'self.audio_padding_duration' will be non-zero in case of audio-zeropadding
-            sent_duration = self.audio_padding_duration + self.dataset.duration(sent)
-            n = int(np.ceil(round(sent_duration/bin_width, 3)))
-
-            # save boundaries of sent thirds (3 sections of each sentence..)
-            one_third = int(n/3)
-            two_third = int(2*n/3)
-            self.sent_sections[sent] = [0, one_third, two_third, n]
-
-            for j, l in enumerate(self.layers):
-                tmp = signal.resample(raw_features[j][sent],n, axis=0)
-                # mean = np.mean(tmp, axis=0)
-                # resampled_features[j][sent] = tmp #- mean
-                if delay_features:
-                    seq_len = tmp.shape[0]
-                    # delay by removing last samples, and trimming the extra length at the start..
-                    tmp =   tmp[self.max_layer_delay-self.layer_delays[j] : seq_len-self.layer_delays[j]]
-                    
-                resampled_features[j][sent] = tmp
+            n = self.num_samples(sent, bin_width)
+            sent_features = self.resample_sent([layer[sent] for layer in raw_features], n, delay_features)
+            for j, feats in enumerate(sent_features):
+                resampled_features[j][sent] = feats
         return resampled_features
 
+    def num_samples(self, sent, bin_width, sent_sections=None, padding_duration=None):
+        """Returns number of samples of 'sent' at 'bin_width' (ms), and saves
+        boundaries of sent thirds in 'sent_sections' (Default: self.sent_sections).
+        Audio padding (sec) is 'padding_duration' (Default: self.audio_padding_duration)."""
+        if sent_sections is None:
+            sent_sections = self.sent_sections
+        if padding_duration is None:
+            # 'self.audio_padding_duration' will be non-zero in case of audio-zeropadding
+            padding_duration = self.audio_padding_duration
+        bin_width = bin_width/1000 # ms
+        sent_duration = padding_duration + self.dataset.duration(sent)
+        n = int(np.ceil(round(sent_duration/bin_width, 3)))
+
+        # save boundaries of sent thirds (3 sections of each sentence..)
+        one_third = int(n/3)
+        two_third = int(2*n/3)
+        sent_sections[sent] = [0, one_third, two_third, n]
+        return n
+
+    def resample_sent(self, sent_features, n, delay_features=False, layer_delays=None):
+        """Returns features (list of all layers) of a sentence resampled to 'n'
+        samples (and delayed by 'layer_delays' (Default: self.layer_delays) 
+        samples, if 'delay_features')."""
+        if delay_features:
+            if layer_delays is None:
+                layer_delays = self.layer_delays
+            max_layer_delay = np.max(layer_delays)
+        resampled = []
+        # all layers resampled together (see 'Resampler')
+        for j, tmp in enumerate(self.resampler.resample(sent_features, n)):
+            # mean = np.mean(tmp, axis=0)
+            # resampled_features[j][sent] = tmp #- mean
+            if delay_features:
+                seq_len = tmp.shape[0]
+                # delay by removing last samples, and trimming the extra length at the start..
+                tmp =   tmp[max_layer_delay-layer_delays[j] : seq_len-layer_delays[j]]
+            resampled.append(self.to_feature_dtype(tmp))
+        return resampled
+
+    def stream_features(self, bin_width, delay_features=False, audio_zeropad=False, sents=None):
+        """
+        Streams features of 'sents' (extracted or read from the feature store, 
+        one sentence at a time) resampled to 'bin_width' into preallocated 
+        memory-mapped buffers, one (total_samples, dim) buffer per layer with 
+        a sentence offset table. Only a single sentence is held in memory.
+
+        Buffer files are written to a temporary directory (under 
+        cache_dir/sampled_features/<model>/) owned by this object, removed 
+        when features are streamed again or the object is discarded (or at 
+        interpreter exit). Empty results (no samples) are kept in memory.
+
+        Returns:
+            List of SentenceBuffer: all layer features, same indexing as 
+                returned by 'resample' (sent -> (time, dim) view).
+        """
+        if sents is None:
+            sents = self.sents
+        self.sent_sections = {}
+        lengths = np.array([self.num_samples(sent, bin_width) for sent in sents], dtype=np.int64)
+        if delay_features:
+            lengths = np.maximum(lengths - self.max_layer_delay, 0)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        position = {sent: x for x, sent in enumerate(sents)}
+
+        buffer_dir = os.path.join(cache_dir, SAMPLED_FEATURES_DIR, self.model_name)
+        os.makedirs(buffer_dir, exist_ok=True)
+        # buffers of previous call (if any) are removed with their directory
+        self.buffers_dir = tempfile.TemporaryDirectory(dir=buffer_dir)
+        buffers = [None]*self.num_layers
+        for sent, sent_features in self.iter_features(audio_zeropad, sents):
+            x = position[sent]
+            n = self.sent_sections[sent][-1]
+            for j, feats in enumerate(self.resample_sent(sent_features, n, delay_features)):
+                if buffers[j] is None:
+                    # allocated once dim (and dtype) of the layer are known...
+                    buffers[j] = self.feature_buffer(j, (offsets[-1], feats.shape[1]), feats.dtype)
+                buffers[j][offsets[x]:offsets[x+1]] = feats
+        # no sentences, nothing to infer dims from...
+        buffers = [np.zeros((0, 0), dtype=np.float32) if b is None else b for b in buffers]
+        return [SentenceBuffer(buffer, sents, offsets) for buffer in buffers]
+
+    def feature_buffer(self, layer, shape, dtype):
+        """Returns memory-mapped buffer (in 'self.buffers_dir') for features of 
+        'layer', in memory if empty (zero-length files can not be mapped)."""
+        if shape[0] == 0:
+            return np.zeros(shape, dtype=dtype)
+        path = os.path.join(self.buffers_dir.name, f'layer_{layer}.dat')
+        return np.memmap(path, dtype=dtype, mode='w+', shape=shape)
+
+    def to_feature_dtype(self, features):
+        """Returns features in the storage dtype 'self.feature_dtype' (if set)."""
+        if self.feature_dtype is None:
+            return features
+        if not isinstance(features, np.ndarray):
+            features = features.detach().cpu().numpy()
+        return features.astype(self.feature_dtype, copy=False)
+
 
 
     def get_features(self, layer):
@@ -226,16 +618,8 @@ class Regression():
         session = str(session)
         # check if session is already loaded, reuse it, otherwise clear all sessions to saved memory.
         if session not in self.list_loaded_sessions():
-            self.spike_datasets.clear()
-            gc.collect()
-            # de-allocation of memory ends here...
-
-            self.spike_datasets = {}
-            self.num_channels = {}
-            self._load_dataset_session(session)
-
+            self._switch_session(session)
             self.get_dataset_object(session).extract_spikes(bin_width, delay, sents=sents)
-            self.num_channels[session] = self.get_dataset_object(session).num_channels
       
         elif force_reload:
             self.get_dataset_object(session).extract_spikes(bin_width, delay, sents=sents)
@@ -247,6 +631,17 @@ class Regression():
         return spikes
     
     
+    def load_spikes(self, session, bin_width=20, delay=0):
+        """Loads spikes of 'session' at (bin_width, delay), spikes of a loaded session
+        binned at another (bin_width, delay) are binned again (derived from the
+        spike pyramid if it covers them, see 'build_spike_pyramid')."""
+        session = str(session)
+        if session not in self.list_loaded_sessions():
+            self._switch_session(session)
+        dataset = self.get_dataset_object(session)
+        if dataset.spikes_key != (bin_width, delay):
+            dataset.extract_spikes(bin_width, delay)
+
     def list_loaded_sessions(self):
         """Returns the list of sessions for which neural data has
         been loaded."""
@@ -255,16 +650,40 @@ class Regression():
     def _load_dataset_session(self, session):
         """Create dataset object for the 'session'"""
         self.spike_datasets[session] = NeuralData(self.data_dir, session)
+
+    def _switch_session(self, session):
+        """Clears all loaded sessions (to save memory) and loads the 'session'."""
+        self.spike_datasets.clear()
+        gc.collect()
+        # de-allocation of memory ends here...
+
+        self.spike_datasets = {}
+        self.num_channels = {}
+        self._load_dataset_session(session)
+        self.num_channels[session] = self.get_dataset_object(session).num_channels
         
 
     def get_normalizer(self, session, sents=None, bin_width=20, delay=0, n=1000):
-        """Compute dist. of normalizer and return median."""
+        """Compute dist. of normalizer and return median,
+        (read from the normalizer cache without loading the session, if cached)."""
+        cached = load_normalizer(self.data_dir, session, sents, bin_width, delay, n)
+        if cached is not None:
+            return cached[1]
         if session not in self.list_loaded_sessions():
             self._load_dataset_session(session)
             _ = self.get_dataset_object(session).extract_spikes(bin_width, delay, sents=sents)
         return self.spike_datasets[session].get_normalizer(sents=sents, bin_width=bin_width, delay=delay, n=n)
         
 
+    def build_spike_pyramid(self, session, bin_widths, delay=0):
+        """Bins spikes of 'session' once for all 'bin_widths' (see 'NeuralData.build_spike_pyramid'),
+        spikes at any of the widths are then derived from it, the session stays
+        loaded (by 'cross_validated_regression') while it has a pyramid."""
+        session = str(session)
+        if session not in self.list_loaded_sessions():
+            self._switch_session(session)
+        self.get_dataset_object(session).build_spike_pyramid(bin_widths, delay=delay)
+
     def get_dataset_object(self, session):
         """Returns spike dataset object if neural data for the input 
         session has already been loaded, otherwise return False."""
@@ -274,6 +693,50 @@ class Regression():
             raise AttributeError(f"Create dataset object for session-{session} before using it.")
 
 
+    def get_feature_stats(self, bin_width=20, sents=None):
+        """Returns per-sentence X^T X of the loaded features (see 'FeatureStatistics'),
+        computed once and reused (by all sessions and delays) while (bin_width, 
+        layers) and the loaded features stay the same."""
+        if sents is None:
+            sents = self.sents
+        key = (bin_width, tuple(self.layers))
+        if self.feature_stats is not None and self.feature_stats_key == key \
+                and self.feature_stats.covers(sents):
+            return self.feature_stats
+        self.feature_stats = None
+        gc.collect()
+        print(f"Computing feature statistics of {len(sents)} sents, bin-width: {bin_width}")
+        self.feature_stats = FeatureStatistics(self.sampled_features, sents)
+        self.feature_stats_key = key
+        return self.feature_stats
+
+    def get_sentence_stats(self, session, bin_width=20, delay=0, sents=None):
+        """Returns per-sentence sufficient statistics (see 'SentenceStatistics')
+        of the loaded features and spikes of 'session', computed once and reused
+        while (session, bin_width, delay) and the loaded features stay the same.
+        X^T X (see 'get_feature_stats') is only computed when features change."""
+        if sents is None:
+            sents = self.sents
+        session = str(session)
+        key = (session, bin_width, delay)
+        if self.stats is not None and self.stats_key == key \
+                and all(sent in self.stats.position for sent in sents):
+            return self.stats
+        self.stats = None
+        gc.collect()
+        feature_stats = self.get_feature_stats(bin_width=bin_width, sents=sents)
+        self.load_spikes(session, bin_width=bin_width, delay=delay)
+        dataset = self.spike_datasets[session]
+        spikes = {
+            sent: dataset.unroll_spikes(sents=[sent], features_delay_trim=self.features_delay_trim)
+            for sent in sents
+        }
+        print(f"Computing sufficient statistics of {len(sents)} sents, session: {session}")
+        self.stats = SentenceStatistics(feature_stats, self.sampled_features, spikes, sents)
+        self.stats_key = key
+        print(f"Sufficient statistics take {self.stats.nbytes/2**30:.2f} GB")
+        return self.stats
+
     ### Methods for the computing correlations and grid search for optimal delay.
 
     def cross_validated_regression(
@@ -313,13 +776,15 @@ class Regression():
         
         # this creates a new dataset object and extracts the spikes
         session = str(session)
-        _ = self.get_neural_spikes(session, bin_width=bin_width, delay=delay)
+        self.load_spikes(session, bin_width=bin_width, delay=delay)
 
         num_channels = self.spike_datasets[session].num_channels
+        stats = None
+        if self.sentence_stats and not self.use_pca:
+            stats = self.get_sentence_stats(session, bin_width=bin_width, delay=delay, sents=sents)
 
         # feature_dims = self.sampled_features[0].shape[1]
         lmbdas = module.logspace(start=-4, stop=-1, num=num_lmbdas)
-        B = module.zeros((self.num_layers, self.feature_dims, num_channels))
         corr_coeff = np.zeros((iterations, num_channels, self.num_layers))
         corr_coeff_train = np.zeros((iterations, num_channels,self.num_layers))
         # stimuli = np.array(list(self.raw_features[0].keys()))
@@ -350,7 +815,8 @@ class Regression():
             # lmbda_loss = module.zeros(((len(lmbdas), num_channels, self.num_layers)))
             start_lmbda = time.time()
             lmbda_loss = self.k_fold_CV(
-                    session, mapping_set=mapping_set, lmbdas=lmbdas, num_folds=num_folds
+                    session, mapping_set=mapping_set, lmbdas=lmbdas, num_folds=num_folds,
+                    stats=stats
                 )
             
             end_lmbda = time.time()
@@ -363,10 +829,12 @@ class Regression():
             # mapping_y = self.unroll_spikes(session, sents=mapping_set, numpy=numpy)
             mapping_y = self.get_neural_spikes(session, sents=mapping_set, numpy=numpy)
             
-            #computing betas
-            for l in range(self.num_layers):
-                for ch in range(num_channels):
-                    B[l,:,ch] = utils.reg(mapping_x[l,:,:], mapping_y[:,ch], optimal_lmbdas[ch,l])
+            #computing betas (all layers and channels, each at its optimal lmbda)
+            if stats is not None:
+                XtX, Xty, _, m = stats.sums(mapping_set, numpy=numpy)
+                B = utils.ridge_solve(XtX, Xty, m, optimal_lmbdas)
+            else:
+                B = utils.ridge_per_channel(mapping_x, mapping_y, optimal_lmbdas)
             self.B[session] = cp.asnumpy(B)
 
             # Loading test set...!
@@ -393,8 +861,10 @@ class Regression():
         corr_coeff_train = cp.asnumpy(corr_coeff_train.transpose((0,2,1)))
         lmbda_loss = lmbda_loss.transpose((0,2,1))
         if return_dict:
-            # deallocate the memory of Neural data for current session, this will save memory used.
-            del self.spike_datasets[session]
+            # deallocate the memory of Neural data for current session, this will save memory used,
+            # (unless its spikes are binned for other widths as well).
+            if self.spike_datasets[session].spike_pyramid is None:
+                del self.spike_datasets[session]
             # saving results in a dictionary..
             corr_coeff_train = np.median(corr_coeff_train, axis=0)
             corr = {'test_cc_raw': corr_coeff,
@@ -412,7 +882,7 @@ class Regression():
 
 
 
-    def k_fold_CV(self, session, mapping_set, lmbdas, num_folds=5, use_cpu=False):
+    def k_fold_CV(self, session, mapping_set, lmbdas, num_folds=5, use_cpu=False, stats=None):
         """Return MSE loss (avg.) for k-fold CV regression.
 
         Args:
@@ -421,6 +891,9 @@ class Regression():
             lmbdas (float): Range of regularization paramters to compare
             num_folds (int): # of folds
             use_cpu (bool): default 'False', use numpy or cupy? 
+            stats (SentenceStatistics): per-sentence statistics (see 'get_sentence_stats'),
+                if given, statistics of each fold are sums of the sentence statistics
+                (features and spikes are not unrolled).
 
         Returns:
             avg. MSE loss for validation set.     
@@ -440,6 +913,13 @@ class Regression():
                 val_set = mapping_set[r*size_of_chunk:]
             train_set = mapping_set[np.isin(mapping_set, val_set, invert=True)]
 
+            if stats is not None:
+                loss = utils.ridge_path_loss_stats(
+                    stats.sums(train_set, numpy=use_cpu), stats.sums(val_set, numpy=use_cpu), lmbdas
+                )
+                lmbda_loss += cp.asnumpy(loss)
+                continue
+
             # load features and spikes using the sent ids.
             train_x = self.unroll_features(sents=train_set, numpy=use_cpu, train_pca=True)
             train_y = self.get_neural_spikes(session, sents=train_set, numpy=use_cpu)
@@ -447,14 +927,10 @@ class Regression():
             val_x = self.unroll_features(sents=val_set, numpy=use_cpu)
             val_y = self.get_neural_spikes(session, sents=val_set, numpy=use_cpu)
 
-            # for the current fold, compute/save validation loss for each lambda.
-            for i, lmbda in enumerate(lmbdas):
-
-                Beta = utils.reg(train_x, train_y, lmbda)
-                val_pred = utils.predict(val_x, Beta)
-
-                loss = utils.mse_loss(val_y, val_pred)
-                lmbda_loss[i] += cp.asnumpy((loss))
+            # for the current fold, compute/save validation loss for all lambdas,
+            # (one eigendecomposition per layer, see 'utils.ridge_path_loss').
+            loss = utils.ridge_path_loss(train_x, train_y, val_x, val_y, lmbdas)
+            lmbda_loss += cp.asnumpy(loss)
 
             # de-allocate train_x and train_y to reduce memroy utilization...
             del train_x
@@ -470,8 +946,6 @@ class Regression():
 
 
     def map_and_score(self, mapping_set, test_set, optimal_lmbdas, use_cpu=False):
-        feature_dims = self.features[0].shape[1]
-        B = cp.zeros((self.num_layers, feature_dims, self.num_channels))
         corr_coeff = np.zeros((self.num_channels, self.num_layers))
         mapping_x = self.unroll_features(mapping_set, numpy=use_cpu)
         # mapping_x = np.stack([mapping_x[i] for i in range(self.num_layers)], axis=0)
@@ -481,9 +955,7 @@ class Regression():
         # test_x = np.stack([test_x[i] for i in range(self.num_layers)], axis=0)
         test_y = self.unroll_spikes(sents=test_set, numpy=use_cpu) 
         
-        for l in range(self.num_layers):
-            for ch in range(self.num_channels):
-                B[l,:,ch] = utils.reg(mapping_x[l,:,:], mapping_y[:,ch], optimal_lmbdas[ch,l])
+        B = utils.ridge_per_channel(mapping_x, mapping_y, optimal_lmbdas)
         
         test_pred = utils.predict(test_x, B)
         corr_coeff = utils.cc_norm(test_y,test_pred)
@@ -511,13 +983,17 @@ class Regression():
         losses = []
         session = str(session)
 
+        # bin spikes for all the delays in one pass, slices are selected below...
+        if session not in self.list_loaded_sessions():
+            self._switch_session(session)
+        dataset = self.get_dataset_object(session)
+        dataset.extract_delayed_spikes(bin_width=bin_width, delays=delays)
+
         for i, delay in enumerate(delays):
 
-            # force reload spikes at the desired delay...
-            print(f"Loading neural spikes with delay: {delay}ms")
-            _ = self.get_neural_spikes(
-                    session, bin_width=bin_width, delay=delay, force_reload=True
-                )
+            # select spikes at the desired delay...
+            print(f"Selecting neural spikes with delay: {delay}ms")
+            dataset.select_delay(delay)
             corr_coeff, _, loss, _ = self.cross_validated_regression(
                     session, bin_width=bin_width, delay=delay, num_folds=num_folds,
                     iterations=iterations, return_dict=False, num_lmbdas=num_lmbdas,
@@ -604,7 +1080,7 @@ class Regression():
         Args:
             layer (int): index of the layer
         """
-        n_channels = self.dataset.num_channels
+        n_channels = self.neural_data.num_channels
         x = self.features[layer]
         y = np.stack([self.spikes[i] for i in range(n_channels)], axis=1)
         # x.shape  = n_samples x n_dims
@@ -662,7 +1138,7 @@ class Regression():
             num_repeats (int): number of simulations
         """
         null_dist = pd.DataFrame(columns=['session','layer','channel','bin_width','delay','shift','method','cc'], dtype=np.float64)
-        n_channels = self.dataset.num_channels
+        n_channels = self.neural_data.num_channels
         session = float(self.session)
         x = self.get_features(layer)
         y = np.stack([self.spikes[:,i] for i in range(n_channels)], axis=1)
@@ -697,7 +1173,7 @@ class Regression():
             num_repeats (int): number of simulations
         """
         null_dist = pd.DataFrame(columns=['session','layer','channel','bin_width','delay','shift','method','cc'])
-        n_channels = self.dataset.num_channels
+        n_channels = self.neural_data.num_channels
         session = float(self.session)
         x = self.get_features(layer)
         y = np.stack([self.spikes[:,i] for i in range(n_channels)], axis=1)
@@ -778,14 +1254,14 @@ class Regression():
         """
         print(f"Computing correlations for layer:{layer} ...")
         sp = 1
-        num_channels = self.dataset.num_channels
+        num_channels = self.neural_data.num_channels
         train_cc_norm = np.zeros(num_channels)
         val_cc_norm = np.zeros(num_channels)
         test_cc_norm = np.zeros(num_channels)
 
         feats, spikes = self.get_feats_and_spikes(layer, win, delay, sents, load_features)
         if normalize:
-            sp_all_channels = self.dataset.signal_power(win)
+            sp_all_channels = self.neural_data.signal_power(win)
         for ch in range(num_channels):
             if normalize:
                 sp = sp_all_channels[ch]
@@ -811,7 +1287,7 @@ class Regression():
             feats = utils.down_sample(feats, k)
             y = utils.down_sample(y,k)
         if normalize:
-            sp = self.dataset.signal_power(win)[channel]
+            sp = self.neural_data.signal_power(win)[channel]
         else:
             sp = 1
         r2t, r2v,r2tt = self.compute_cc_norm(feats, y, sp, normalize=normalize)
@@ -864,7 +1340,7 @@ class Regression():
 
     def get_Poiss_scores_layer(self, layer, win, delay=0, sents= np.arange(1,499), load_features=False):
         print(f"Computing Poisson scores for layer:{layer} ...")
-        num_channels = self.dataset.num_channels
+        num_channels = self.neural_data.num_channels
         train_scores = np.zeros(num_channels)
         val_scores = np.zeros(num_channels)
         test_scores = np.zeros(num_channels)
@@ -936,7 +1412,7 @@ class Regression():
         spikes ={}
         spk_mean = {}
         for x,i in enumerate(range(sent_s,sent_e)):
-            spikes[x] = torch.tensor(self.dataset.retrieve_spike_counts(sent=i, win=w ,early_spikes=False)[ch])
+            spikes[x] = torch.tensor(self.neural_data.retrieve_spike_counts(sent=i, win=w ,early_spikes=False)[ch])
             spk_mean[x] = torch.mean(spikes[x], dim = 0)
             spikes[x] = spikes[x] - spk_mean[x]
         spikes = torch.cat([spikes[i] for i in range(sent_e - sent_s)], dim = 0).numpy()
@@ -947,11 +1423,11 @@ class Regression():
     def benchmark_r2_score(self, w = 40, sent = 12):
         #These sentences have repeated trials...!
         #sents = [12,13,32,43,56,163,212,218,287,308]
-        r2_scores = np.zeros(self.dataset.num_channels)
+        r2_scores = np.zeros(self.neural_data.num_channels)
         #trials = obj.dataset.get_trials(13)
-        spkk = self.dataset.retrieve_spike_counts_for_all_trials(sent=sent, w=w)
+        spkk = self.neural_data.retrieve_spike_counts_for_all_trials(sent=sent, w=w)
 
-        for i in range(self.dataset.num_channels):
+        for i in range(self.neural_data.num_channels):
             h1 = np.mean(spkk[i][0:6], axis=0)
             h2 = np.mean(spkk[i][6:], axis=0)
             r2_scores[i] = self.r2(h1,h2)
@@ -961,10 +1437,10 @@ class Regression():
     def compute_r2(self, layer, win):
         k = int(win/40)    # 40 is the min, bin size for 'Speech2Text' transformer model 
         # print(f"k = {k}")
-        r2t = np.zeros(self.dataset.num_channels)
-        r2v = np.zeros(self.dataset.num_channels)
-        pct = np.zeros(self.dataset.num_channels)
-        pcv = np.zeros(self.dataset.num_channels)
+        r2t = np.zeros(self.neural_data.num_channels)
+        r2v = np.zeros(self.neural_data.num_channels)
+        pct = np.zeros(self.neural_data.num_channels)
+        pcv = np.zeros(self.neural_data.num_channels)
 
         #downsamples if k>1 
         if k >1:
@@ -976,7 +1452,7 @@ class Regression():
         x_train = feats[0:m, :]
         x_test = feats[m:, :]
 
-        for i in range(self.dataset.num_channels):
+        for i in range(self.neural_data.num_channels):
             y = self.simply_spikes(ch=i)
             if k>1:
                 y = utils.down_sample(y,k)
@@ -61,10 +61,13 @@ class OptimalInput():
         else:
             inp = torch.tensor(self.linear_model.dataset.audio(starting_sent), dtype=torch.float32)
 
+        # starting spectrogram of a sentence is reused (see 'frontend_cache'), 
+        # random starting inputs are not cached.
+        cache = starting_sent != 0
         if self.model_name == 'speech2text':
-            inp = SyntheticInputUtils.get_spectrogram(inp)
+            inp = SyntheticInputUtils.get_spectrogram(inp, cache=cache)
         elif self.model_name == 'deepspeech2':
-            inp = self.linear_model.model_extractor.extractor.get_spectrogram(inp)
+            inp = self.linear_model.model_extractor.extractor.get_spectrogram(inp, cache=cache)
         
         inp = inp.unsqueeze(dim=0)
         inp.requires_grad = True
@@ -106,7 +109,8 @@ class OptimalInput():
 
     def fwd_pass(self, input, layer_id, ch, session):
             layer_idx = self.get_layer_index(layer_id=layer_id)
-            self.linear_model.model_extractor.translate(input, grad=True)
+            # forward pass (and its graph) only up to 'layer_idx'...
+            self.linear_model.model_extractor.translate(input, grad=True, layers=[layer_idx])
             feats = self.linear_model.model_extractor.get_features(layer_idx)
             # pred = utils.predict(feats, self.B[layer,:,ch])
             betas = self.get_betas(session)
@@ -0,0 +1,114 @@
+import numpy as np
+
+# import GPU specific packages...
+from auditory_cortex import hpc_cluster
+if hpc_cluster:
+    import cupy as cp
+
+# bound on the (bytes) of per-sentence statistics gathered at once by 'sums'
+SUM_BUFFER_BYTES = 2**28
+
+
+def stacked_sum(stacked, x):
+    """Returns sum of the per-sentence arrays stacked[x] (along axis 0),
+    gathered in chunks of at most SUM_BUFFER_BYTES."""
+    x = np.asarray(x, dtype=np.int64)
+    chunk = max(1, SUM_BUFFER_BYTES // max(1, stacked[0].nbytes))
+    total = stacked[x[:chunk]].sum(axis=0)
+    for start in range(chunk, x.size, chunk):
+        total += stacked[x[start:start+chunk]].sum(axis=0)
+    return total
+
+
+class FeatureStatistics:
+    """Per-sentence X^T X (and number of samples) of features of all layers,
+    these do not depend on the spikes (session or delay), so are shared by
+    the 'SentenceStatistics' of all sessions and delays at the same features.
+
+    Args:
+        features (list): (one per layer) mappings of sent -> (time, d) features.
+        sents (list): sent ID's.
+    """
+    def __init__(self, features, sents):
+        self.sents = list(sents)
+        self.position = {sent: x for x, sent in enumerate(self.sents)}
+        num_layers = len(features)
+        d = features[0][self.sents[0]].shape[1]
+
+        self.XtX = np.zeros((len(self.sents), num_layers, d, d))
+        self.counts = np.zeros(len(self.sents), dtype=np.int64)
+        for x, sent in enumerate(self.sents):
+            for j in range(num_layers):
+                feats = np.asarray(features[j][sent], dtype=np.float64)
+                self.XtX[x, j] = feats.T @ feats
+            self.counts[x] = feats.shape[0]
+
+    @property
+    def nbytes(self):
+        """Memory (bytes) of the statistics."""
+        return self.XtX.nbytes + self.counts.nbytes
+
+    def covers(self, sents):
+        """Returns True if statistics of all 'sents' are available."""
+        return all(sent in self.position for sent in sents)
+
+
+class SentenceStatistics:
+    """Per-sentence sufficient statistics of regression of spikes on features
+    of all layers: X^T X, X^T y, y^T y and number of samples for every sentence.
+    Statistics of any set of sentences (CV folds, mapping set) are sums over
+    the sentence ID's (see 'sums'), used with 'utils.ridge_path_loss_stats',
+    so cost of cross-validation does not grow with the number of time bins.
+    X^T X is taken from 'feature_stats' (see 'FeatureStatistics'), only the
+    spike dependent X^T y and y^T y are computed here.
+
+    Not valid with PCA (features are projected by PCA fitted on each training set).
+    Memory: sents x layers x d x (d + channels) x 8 bytes (float64), e.g. ~28 GB
+    for 499 sents, 12 layers and d=768, use for networks of moderate 'd'.
+
+    Args:
+        feature_stats (FeatureStatistics): X^T X of the features, covering 'sents'.
+        features (list): (one per layer) mappings of sent -> (time, d) features.
+        spikes (mapping): sent -> (time, channels) spikes, aligned with features.
+        sents (list): sent ID's.
+    """
+    def __init__(self, feature_stats, features, spikes, sents):
+        self.feature_stats = feature_stats
+        self.sents = list(sents)
+        self.position = {sent: x for x, sent in enumerate(self.sents)}
+        num_layers = len(features)
+        d = feature_stats.XtX.shape[-1]
+        num_channels = spikes[self.sents[0]].shape[1]
+
+        self.Xty = np.zeros((len(self.sents), num_layers, d, num_channels))
+        self.yty = np.zeros((len(self.sents), num_channels))
+        for x, sent in enumerate(self.sents):
+            y = np.asarray(spikes[sent], dtype=np.float64)
+            num_samples = feature_stats.counts[feature_stats.position[sent]]
+            if num_samples != y.shape[0]:
+                raise ValueError(
+                    f"Features and spikes of sent-{sent} are not aligned: "
+                    f"{num_samples} vs {y.shape[0]} samples."
+                )
+            self.yty[x] = np.sum(y**2, axis=0)
+            for j in range(num_layers):
+                feats = np.asarray(features[j][sent], dtype=np.float64)
+                self.Xty[x, j] = feats.T @ y
+
+    @property
+    def nbytes(self):
+        """Memory (bytes) of the statistics (including X^T X)."""
+        return self.feature_stats.nbytes + self.Xty.nbytes + self.yty.nbytes
+
+    def sums(self, sents, numpy=True):
+        """Returns statistics (X^T X, X^T y, y^T y, m) of 'sents', as sums of the
+        per-sentence statistics, (cupy arrays if numpy=False)."""
+        x = [self.position[sent] for sent in sents]
+        x_features = [self.feature_stats.position[sent] for sent in sents]
+        XtX = stacked_sum(self.feature_stats.XtX, x_features)
+        Xty = stacked_sum(self.Xty, x)
+        yty = stacked_sum(self.yty, x)
+        m = int(self.feature_stats.counts[x_features].sum())
+        if not numpy:
+            XtX, Xty, yty = cp.asarray(XtX), cp.asarray(Xty), cp.asarray(yty)
+        return XtX, Xty, yty, m
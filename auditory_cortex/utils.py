@@ -2,21 +2,22 @@ import os
 import yaml
 import pickle
 
-import torch
-import torchaudio
-
-import torch.nn as nn
-
 import numpy as np
-import pandas as pd
-
-import matplotlib as mpl
 from scipy import linalg
-import matplotlib.pylab as plt
 
 # local
-from auditory_cortex import session_to_coordinates, CMAP_2D
+from auditory_cortex import lazy_import
+from auditory_cortex import session_to_coordinates
 from auditory_cortex import results_dir, aux_dir, saved_corr_dir
+from auditory_cortex.frontend_cache import get_frontend_cache
+
+# imported on first use...
+torch = lazy_import('torch')
+torchaudio = lazy_import('torchaudio')
+nn = lazy_import('torch.nn')
+pd = lazy_import('pandas')
+mpl = lazy_import('matplotlib')
+plt = lazy_import('matplotlib.pylab')
 
 # import GPU specific packages...
 from auditory_cortex import hpc_cluster
@@ -25,6 +26,9 @@ if hpc_cluster:
 
 # from pycolormap_2d import ColorMap2DBremm
 
+# parameters of kaldi fbank front-end (key of its front-end cache)
+KALDI_FBANK_PARAMS = {'num_mel_bins': 80, 'window_type': 'hanning', 'scale': 2**15, 'normalize': True}
+
 
 # def get_2d_cmap(session, clrm1 ='YlGnBu', clrm2 = 'YlOrRd'):
     
@@ -68,8 +72,18 @@ class SyntheticInputUtils:
         return x
     
     @classmethod
-    def get_spectrogram(cls, waveform):
-        """Returns spectrogram for the input waveform (ndarray or tensor)"""
+    def get_spectrogram(cls, waveform, cache=True):
+        """Returns spectrogram for the input waveform (ndarray or tensor),
+        computed once per waveform (see 'frontend_cache'), use cache=False
+        for synthetic inputs that are not going to be repeated."""
+        if not cache:
+            return cls.compute_spectrogram(waveform)
+        frontend = get_frontend_cache('kaldi_fbank', KALDI_FBANK_PARAMS)
+        return torch.as_tensor(frontend.get(waveform, cls.compute_spectrogram))
+
+    @classmethod
+    def compute_spectrogram(cls, waveform):
+        """Computes spectrogram for the input waveform (ndarray or tensor)"""
         if not torch.is_tensor(waveform):
             waveform = torch.tensor(waveform)
         waveform = torch.atleast_2d(waveform)
@@ -92,7 +106,7 @@ class SyntheticInputUtils:
             waveform = torch.tensor(waveform)
         if waveform.ndim == 1:
             waveform = waveform.unsqueeze(dim=0)
-            waveform = cls.get_spectrogram(waveform)
+            waveform = cls.get_spectrogram(waveform, cache=False)
         # waveform = waveform * (2 ** 15)
         # kaldi = torchaudio.compliance.kaldi.fbank(waveform, num_mel_bins=80, window_type='hanning')
         # kaldi = cls.normalize(kaldi)
@@ -272,6 +286,7 @@ class CorrelationUtils:
 
 
 def get_2d_cmap(session):
+    from auditory_cortex import CMAP_2D
     cmap_2d = CMAP_2D(range_x=(-2, 2), range_y=(-2, 2))
     coordinates = session_to_coordinates[int(session)]
     color = coordinates_to_color(cmap_2d, coordinates)
@@ -297,10 +312,10 @@ def down_sample(data, k):
         out[i] = data[k*i:k*(i+1)].sum(axis=0)
     return out
 
-@torch.no_grad()
 def poisson_regression_score(model, X, Y):
     # Poisson Prediction with Poisson Score....!
-    eta = model(X)
+    with torch.no_grad():
+        eta = model(X)
     Y_hat = np.exp(eta)
     # eta = np.log(Y_hat)
     Y_mean = Y.mean()
@@ -587,15 +602,176 @@ def reg(X,y, lmbda=0):
     else:
         module = cp
     
-    if X.ndim ==2:
-        X = module.expand_dims(X,axis=0)
-    d = X.shape[2]
-    m = X.shape[1]
-    a = module.matmul(X.transpose((0,2,1)), X) + m*lmbda*module.eye(d)
-    b = module.matmul(X.transpose((0,2,1)), y)
+    d = X.shape[-1]
+    m = X.shape[-2]
+    a, b = normal_equations(X, y)
+    a = a + m*lmbda*module.eye(d)
     B = module.linalg.solve(a,b)
     return B.squeeze()
 
+def ridge_eigh(XtX, Xty):
+    """Returns eigendecomposition of X^T X (per layer) and projection of X^T y,
+    shared by the ridge solutions of all lmbdas (see 'ridge_path').
+
+    Args:
+        XtX (ndarray): (layers, d, d) X^T X (see 'normal_equations').
+        Xty (ndarray): (layers, d, channels) X^T y.
+
+    Returns:
+        s (ndarray): (layers, d) eigenvalues of X^T X.
+        V (ndarray): (layers, d, d) eigenvectors of X^T X.
+        z (ndarray): (layers, d, channels) V^T X^T y.
+    """
+    if type(XtX).__module__ == np.__name__:
+        module = np
+    else:
+        module = cp
+    s, V = module.linalg.eigh(XtX.astype(module.float64))
+    z = module.matmul(V.transpose((0,2,1)), Xty)
+    return s, V, z
+
+def normal_equations(X, y):
+    """Returns (X^T X, X^T y) as (layers, d, d) and (layers, d, channels) for
+    (layers, m, d) or (m, d) features X and (m, channels) or (m,) targets y,
+    features stored at reduced precision (e.g. float16) are upcast only here,
+    one layer at a time, normal equations overflow in half precision."""
+    if type(X).__module__ == np.__name__:
+        module = np
+    else:
+        module = cp
+    if X.ndim ==2:
+        X = module.expand_dims(X,axis=0)
+    if y.ndim ==1:
+        y = module.expand_dims(y,axis=1)
+    if not is_reduced_precision(X):
+        X_T = X.transpose((0,2,1))
+        return module.matmul(X_T, X), module.matmul(X_T, y)
+    a, b = [], []
+    for x in X:
+        x = x.astype(module.float32)
+        a.append(module.matmul(x.T, x))
+        b.append(module.matmul(x.T, y))
+    return module.stack(a, axis=0), module.stack(b, axis=0)
+
+def sufficient_stats(X, y):
+    """Returns sufficient statistics (X^T X, X^T y, y^T y, m) of regression 
+    of y on X (see 'normal_equations' for shapes), y^T y is (channels,)."""
+    if type(X).__module__ == np.__name__:
+        module = np
+    else:
+        module = cp
+    if y.ndim ==1:
+        y = module.expand_dims(y,axis=1)
+    XtX, Xty = normal_equations(X, y)
+    yty = module.sum(y.astype(module.float64)**2, axis=0)
+    return XtX, Xty, yty, X.shape[-2]
+
+def ridge_path(X, y, lmbdas):
+    """Ridge regression (same as 'reg') for all 'lmbdas', from a single
+    eigendecomposition of X^T X per layer, betas of each lmbda cost a
+    diagonal scaling and one rotation (no new solve).
+
+    Args:
+        X (ndarray): (layers, m, d) or (m, d) features.
+        y (ndarray): (m, channels) or (m,) targets.
+        lmbdas (ndarray): (K,) regularization parameters.
+
+    Returns:
+        ndarray: (K, layers, d, channels) betas for all lmbdas.
+    """
+    if type(X).__module__ == np.__name__:
+        module = np
+    else:
+        module = cp
+    m = X.shape[-2]
+    s, V, z = ridge_eigh(*normal_equations(X, y))
+    lmbdas = module.asarray(lmbdas, dtype=module.float64)
+    c = z[None] / (s[None,:,:,None] + m*lmbdas[:,None,None,None])
+    return module.matmul(V[None], c)
+
+def ridge_per_channel(X, y, lmbdas):
+    """Ridge regression of every channel on every layer at its own lmbda
+    (same as 'reg(X[l], y[:,ch], lmbdas[ch,l])' for all layers and channels),
+    from a single eigendecomposition of X^T X per layer (see 'ridge_solve').
+
+    Args:
+        X (ndarray): (layers, m, d) or (m, d) features.
+        y (ndarray): (m, channels) or (m,) targets.
+        lmbdas (ndarray): (channels, layers) regularization parameters.
+
+    Returns:
+        ndarray: (layers, d, channels) betas.
+    """
+    XtX, Xty = normal_equations(X, y)
+    return ridge_solve(XtX, Xty, X.shape[-2], lmbdas)
+
+def ridge_solve(XtX, Xty, m, lmbdas):
+    """Ridge betas from normal equations (or sufficient statistics, see
+    'sufficient_stats') of m samples, for (channels, layers) 'lmbdas', all
+    channels of a layer are solved together in the eigenbasis of X^T X.
+
+    Returns:
+        ndarray: (layers, d, channels) betas.
+    """
+    if type(XtX).__module__ == np.__name__:
+        module = np
+    else:
+        module = cp
+    s, V, z = ridge_eigh(XtX, Xty)
+    lmbdas = module.asarray(lmbdas, dtype=module.float64).reshape(z.shape[2], z.shape[0])
+    c = z / (s[:,:,None] + m*lmbdas.T[:,None,:])
+    return module.matmul(V, c)
+
+def ridge_path_loss(X, y, X_val, y_val, lmbdas):
+    """Validation MSE of ridge regression for all 'lmbdas' (same as 'mse_loss' 
+    of 'predict(X_val, reg(X, y, lmbda))' for each lmbda), from a single 
+    eigendecomposition of X^T X per layer (see 'ridge_path_loss_stats').
+
+    Args:
+        X (ndarray): (layers, m, d) training features.
+        y (ndarray): (m, channels) training targets.
+        X_val (ndarray): (layers, m_val, d) validation features.
+        y_val (ndarray): (m_val, channels) validation targets.
+        lmbdas (ndarray): (K,) regularization parameters.
+
+    Returns:
+        ndarray: (K, channels, layers) validation MSE for all lmbdas.
+    """
+    return ridge_path_loss_stats(sufficient_stats(X, y), sufficient_stats(X_val, y_val), lmbdas)
+
+def ridge_path_loss_stats(train_stats, val_stats, lmbdas):
+    """Validation MSE of ridge regression for all 'lmbdas', computed from the
+    sufficient statistics (X^T X, X^T y, y^T y, m) of training and validation 
+    sets only (see 'sufficient_stats'). Loss is evaluated in the eigenbasis of
+    training X^T X, so cost per lmbda does not grow with the number of 
+    samples and there is no solve per lmbda.
+
+    Returns:
+        ndarray: (K, channels, layers) validation MSE for all lmbdas.
+    """
+    XtX, Xty, _, m = train_stats
+    G, h, yy, m_val = val_stats
+    if type(XtX).__module__ == np.__name__:
+        module = np
+    else:
+        module = cp
+    s, V, z = ridge_eigh(XtX, Xty)
+    # validation statistics, rotated to the eigenbasis...
+    V_T = V.transpose((0,2,1))
+    G = module.matmul(module.matmul(V_T, G), V)
+    h = module.matmul(V_T, h)
+
+    lmbdas = module.asarray(lmbdas, dtype=module.float64)
+    c = z[None] / (s[None,:,:,None] + m*lmbdas[:,None,None,None])
+    # |y_val - X_val B|^2 = y^T y - 2 h^T c + c^T G c
+    loss = yy - 2*module.sum(h[None]*c, axis=2) + module.sum(c*module.matmul(G[None], c), axis=2)
+    loss = module.maximum(loss, 0)/m_val
+    return loss.transpose((0,2,1))
+
+def is_reduced_precision(X):
+    """Returns True if X is floating point array of less than single precision."""
+    return X.dtype.kind == 'f' and X.dtype.itemsize < 4
+
 # def reg_cp(X,y, lmbda=0):
 #     # takes in cupy arrays and uses gpu...!
 #     if X.ndim ==2:
@@ -628,7 +804,11 @@ def predict(X, B):
         module = np
     else:
         module = cp
-    pred = module.matmul(X,B)
+    if is_reduced_precision(X) and X.ndim == 3 and B.ndim == 3:
+        # upcast one layer at a time (see 'reg')
+        pred = module.stack([module.matmul(x.astype(module.float32), b) for x, b in zip(X, B)], axis=0)
+    else:
+        pred = module.matmul(X,B)
     if pred.ndim ==3:
         return pred.transpose(1,2,0) 
     return pred 
@@ -686,21 +866,43 @@ def mse_loss(y, y_hat):
 #         y = cp.expand_dims(y, axis=-1)
 #     return (cp.sum((y - y_hat)**2, axis=0))/y_hat.shape[0]
 
+def trial_pairs_corr(spikes):
+    """Compute correlations (same formula as 'cc_norm') between all pairs 
+    of trials, for all channels in one batched operation.
+
+    Args: 
+        spikes (ndarray): (repeats, samples/time, channels)
+
+    Returns:
+        pairs (ndarray): (num_pairs, 2) trial indices (i, j) with i < j.
+        pairs_corr (ndarray): (num_pairs, channels) inter-trial correlations.
+    """
+    spikes = np.asarray(spikes, dtype=np.float64)
+    repeats, samples = spikes.shape[:2]
+    centered = (spikes - spikes.mean(axis=1, keepdims=True)).transpose(2,0,1)
+    # (channels, repeats, repeats) sums of products of all trial pairs...
+    gram = np.matmul(centered, centered.transpose(0,2,1))
+    var = np.diagonal(gram, axis1=1, axis2=2).T / samples
+    i, j = np.triu_indices(repeats, k=1)
+    pairs_corr = (gram[:,i,j].T / (samples - 1)) / (np.sqrt(var[i]*var[j]) + 1.0e-8)
+    return np.stack([i, j], axis=1), pairs_corr
+
 def inter_trial_corr(spikes, n=1000):
-    """Compute distribution of inter-trials correlations.
+    """Compute distribution of inter-trials correlations, by drawing random
+    trial pairs from the table of all pairs (see 'trial_pairs_corr').
 
     Args: 
         spikes (ndarray): (repeats, samples/time, channels)
+        n (int): number of samples, if None exact distribution 
+            (one entry per trial pair) is returned.
 
     Returns:
         trials_corr (ndarray): (n, channels) distribution of inter-trial correlations
     """
-    trials_corr = np.zeros((n, spikes.shape[2]))
-    for t in range(n):
-        trials = np.random.choice(np.arange(0,spikes.shape[0]), size=2, replace=False)
-        trials_corr[t] = cc_norm(spikes[trials[0]].squeeze(), spikes[trials[1]].squeeze())
-
-    return trials_corr
+    _, pairs_corr = trial_pairs_corr(spikes)
+    if n is None:
+        return pairs_corr
+    return pairs_corr[np.random.randint(0, pairs_corr.shape[0], size=n)]
 
 def normalize(x):
     # Normalize for spectrogram
@@ -714,12 +916,9 @@ def normalize(x):
     return x
 
 def spectrogram(aud):
-    waveform = torch.tensor(aud, dtype=torch.float32).unsqueeze(dim=0)
-    waveform = waveform * (2 ** 15)
-    kaldi = torchaudio.compliance.kaldi.fbank(waveform, num_mel_bins=80, window_type='hanning')
-    kaldi = normalize(kaldi)
-
-    return kaldi.transpose(0,1)
+    """Returns (80, time) kaldi fbank spectrogram of 'aud' (cached per waveform)."""
+    waveform = np.asarray(aud, dtype=np.float32)
+    return SyntheticInputUtils.get_spectrogram(waveform).transpose(0,1)
 
 def write_optimal_delays(filename, result):
     if os.path.exists(filename):
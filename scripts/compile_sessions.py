@@ -0,0 +1,29 @@
+import os
+import time
+import numpy as np
+
+# local
+from auditory_cortex import config
+from auditory_cortex.dataset import compile_session
+
+# One-time step: compiles __MUspk.mat files of every session into the flat
+# (memory-mappable) layout read by NeuralData.
+
+START = time.time()
+
+data_dir = config['neural_data_dir']
+
+## read the sessions available in data_dir
+sessions = np.array(os.listdir(data_dir))
+sessions = np.delete(sessions, np.where(sessions == "out_sentence_details_timit_all_loudness.mat"))
+sessions = np.sort(sessions)
+
+for session in sessions:
+    if not os.path.isdir(os.path.join(data_dir, session)):
+        continue
+    print(f"Compiling session: {session} ... ", end='')
+    out_dir = compile_session(data_dir, session)
+    print(f"written to '{out_dir}'")
+
+END = time.time()
+print(f"Took {(END-START)/60:.2f} min., to compile {len(sessions)} sessions.")
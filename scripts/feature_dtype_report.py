@@ -0,0 +1,77 @@
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+# local
+from auditory_cortex import config
+import auditory_cortex.utils as utils
+import auditory_cortex.models as models
+
+# Reports memory of the features (resident 'sampled_features' and peak during
+# resampling + regression) for each storage dtype (see 'Regression.feature_dtype'),
+# along with drift of test correlations w.r.t. the float64 path (raw features
+# cast to float64 before resampling and regression).
+# Usage: python feature_dtype_report.py [session] [bin_width]
+
+START = time.time()
+
+DTYPES = ['float64', 'float32', 'float16']
+LMBDA = 1.0e-2      # fixed regularization, so only the feature dtype differs
+SEED = 0
+
+model_name = config['model_name']
+session = sys.argv[1] if len(sys.argv) > 1 else str(config['optimal_inputs_param']['sessions'][0])
+bin_width = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+obj = models.Regression(model_name=model_name, load_features=False)
+raw_features = obj.extract_features()
+if not obj.use_pca:
+    obj.feature_dims = raw_features[0][obj.sents[0]].shape[1]
+
+# same mapping/test split for all dtypes...
+sents = np.random.default_rng(SEED).permutation(obj.sents)
+mapping_set = sents[:int(0.7*len(sents))]
+test_set = sents[int(0.7*len(sents)):]
+mapping_y = obj.get_neural_spikes(session, bin_width=bin_width, sents=mapping_set, numpy=True)
+test_y = obj.get_neural_spikes(session, bin_width=bin_width, sents=test_set, numpy=True)
+num_channels = test_y.shape[1]
+
+report = {}
+for dtype in DTYPES:
+    obj.feature_dtype = models.get_feature_dtype(dtype)
+    if obj.feature_dtype == np.float64:
+        # reference path, resampled and solved entirely in float64...
+        features = [{sent: np.asarray(feats, dtype=np.float64) for sent, feats in layer.items()} for layer in raw_features]
+    else:
+        features = raw_features
+    tracemalloc.start()
+    obj.sampled_features = obj.resample(features, bin_width)
+    resident = sum(f.nbytes for layer in obj.sampled_features for f in layer.values())
+
+    mapping_x = obj.unroll_features(sents=mapping_set, numpy=True, train_pca=True)
+    B = utils.reg(mapping_x, mapping_y, LMBDA)
+    del mapping_x
+    test_pred = utils.predict(obj.unroll_features(sents=test_set, numpy=True), B)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    # (layers, channels) test correlations
+    corr = np.stack([
+        utils.cc_single_channel(test_y[:, ch], test_pred[:, ch, :]) for ch in range(num_channels)
+    ], axis=1)
+    report[dtype] = (resident, peak, corr)
+    del obj.sampled_features, B, test_pred, features
+
+ref_resident, ref_peak, ref_corr = report['float64']
+print(f"\nModel: '{model_name}', session: {session}, bin_width: {bin_width}ms, lmbda: {LMBDA}")
+print(f"{'dtype':>8} {'features (MB)':>14} {'peak (MB)':>10} {'vs float64':>11} {'max |d corr|':>13} {'median |d corr|':>16}")
+for dtype, (resident, peak, corr) in report.items():
+    drift = np.abs(corr - ref_corr)
+    print(
+        f"{dtype:>8} {resident/2**20:>14.1f} {peak/2**20:>10.1f} {peak/ref_peak:>10.2f}x "
+        f"{np.max(drift):>13.2e} {np.median(drift):>16.2e}"
+    )
+
+END = time.time()
+print(f"Took {(END-START)/60:.2f} min.")
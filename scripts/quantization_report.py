@@ -0,0 +1,75 @@
+import sys
+import time
+import numpy as np
+
+# local
+from auditory_cortex import config
+import auditory_cortex.models as models
+
+# Fidelity report of dynamic int8 quantized inference ('quantize' in the
+# network's config), compares the quantized network against the float one
+# on a subset of sentences:
+#   - extraction time (CPU),
+#   - per-layer activations (correlation and relative error),
+#   - per-layer test correlations ('test_cc_raw') of the regression.
+# Usage: python quantization_report.py [model_name] [session] [num_sents]
+
+START = time.time()
+
+model_name = sys.argv[1] if len(sys.argv) > 1 else config['model_name']
+session = sys.argv[2] if len(sys.argv) > 2 else str(config['optimal_inputs_param']['sessions'][0])
+num_sents = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+bin_width = 20
+use_cpu = config['use_cpu']
+SEED = 0
+
+sents = np.sort(np.random.default_rng(SEED).permutation(np.arange(1, 500))[:num_sents])
+
+timings = {}
+raw_features = {}
+test_cc = {}
+for name, quantize in (('float', False), ('int8', True)):
+    obj = models.Regression(model_name=model_name, load_features=False, quantize=quantize)
+    obj.sents = sents
+    extractor = obj.model_extractor
+
+    # features are extracted here (not read from the feature store), to time the network...
+    features = [{} for _ in range(obj.num_layers)]
+    start = time.time()
+    for sent in sents:
+        extractor.translate(obj.audio_input(sent), grad=False)
+        for j in range(obj.num_layers):
+            features[j][sent] = np.asarray(extractor.get_features(j), dtype=np.float32)
+    timings[name] = time.time() - start
+    raw_features[name] = features
+
+    if not obj.use_pca:
+        obj.feature_dims = features[0][sents[0]].shape[1]
+    obj.sampled_features = obj.resample(features, bin_width)
+    # same splits for both networks...
+    np.random.seed(SEED)
+    corr_dict = obj.cross_validated_regression(
+        session, bin_width=bin_width, iterations=1, N_sents=len(sents),
+        return_dict=True, numpy=use_cpu, sents=sents
+    )
+    test_cc[name] = corr_dict['test_cc_raw']     # (layers, channels)
+    layer_ids = obj.layer_ids
+    del obj, extractor
+
+print(f"\nModel: '{model_name}', session: {session}, {len(sents)} sentences")
+print(f"Extraction time: float {timings['float']:.1f}s, int8 {timings['int8']:.1f}s "
+      f"(speedup {timings['float']/timings['int8']:.2f}x)")
+print(f"{'layer':>6} {'act. corr':>10} {'act. rel err':>13} {'cc float':>9} {'cc int8':>8} {'median |d cc|':>14}")
+for j, layer_id in enumerate(layer_ids):
+    f = np.concatenate([raw_features['float'][j][sent].ravel() for sent in sents])
+    q = np.concatenate([raw_features['int8'][j][sent].ravel() for sent in sents])
+    act_corr = np.corrcoef(f, q)[0, 1]
+    rel_err = np.linalg.norm(q - f)/np.linalg.norm(f)
+    drift = np.abs(test_cc['int8'][j] - test_cc['float'][j])
+    print(
+        f"{layer_id:>6} {act_corr:>10.4f} {rel_err:>13.2e} {np.median(test_cc['float'][j]):>9.3f} "
+        f"{np.median(test_cc['int8'][j]):>8.3f} {np.median(drift):>14.2e}"
+    )
+
+END = time.time()
+print(f"Took {(END-START)/60:.2f} min.")
@@ -0,0 +1,59 @@
+import sys
+import time
+import numpy as np
+from scipy import signal
+
+# local
+from auditory_cortex import config
+import auditory_cortex.models as models
+from auditory_cortex.resampling import Resampler
+
+# Compares total time of resampling all (sentence, layer) features with
+# per-pair FFT 'signal.resample' (previous path) against 'Resampler' (all 
+# layers of a sentence at once), default exact FFT path and opt-in cached 
+# operators (equal up to rounding), and checks parity.
+# Usage: python resample_benchmark.py [model_name] [bin_width]
+
+model_name = sys.argv[1] if len(sys.argv) > 1 else config['model_name']
+bin_width = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+obj = models.Regression(model_name=model_name, load_features=False)
+raw_features = obj.extract_features()
+# read from the feature store once, so both paths time resampling only...
+raw_features = [{sent: np.array(feats) for sent, feats in layer.items()} for layer in raw_features]
+obj.sent_sections = {}
+lengths = {sent: obj.num_samples(sent, bin_width) for sent in obj.sents}
+
+start = time.time()
+fft_features = [
+    {sent: signal.resample(layer[sent], lengths[sent], axis=0) for sent in obj.sents}
+    for layer in raw_features
+]
+fft_time = time.time() - start
+
+def run_resampler(resampler):
+    """Returns (features resampled by 'resampler', time taken)."""
+    start = time.time()
+    engine_features = [{} for _ in range(obj.num_layers)]
+    for sent in obj.sents:
+        resampled = resampler.resample([layer[sent] for layer in raw_features], lengths[sent])
+        for j, feats in enumerate(resampled):
+            engine_features[j][sent] = feats
+    return engine_features, time.time() - start
+
+print(f"\nModel: '{model_name}', bin_width: {bin_width}ms, {len(obj.sents)} sentences, {obj.num_layers} layers")
+print(f"signal.resample (per sentence, layer): {fft_time:.2f}s")
+for label, resampler in [
+        ('Resampler (FFT, default)', Resampler()),
+        ('Resampler (cached operators)', Resampler(max_operator_len=512)),
+    ]:
+    engine_features, engine_time = run_resampler(resampler)
+    print(f"\n{label}: {engine_time:.2f}s ({fft_time/engine_time:.2f}x), "
+          f"operators: {resampler.misses} built, {resampler.hits} reused")
+    print(f"{'layer':>6} {'max abs err':>12} {'max rel err':>12} {'bitwise equal':>14}")
+    for j, layer_id in enumerate(obj.layer_ids):
+        fft, engine = fft_features[j], engine_features[j]
+        abs_err = max(np.max(np.abs(engine[sent] - fft[sent]), initial=0) for sent in obj.sents)
+        scale = max(np.max(np.abs(fft[sent]), initial=0) for sent in obj.sents)
+        equal = np.mean([np.array_equal(engine[sent], fft[sent]) for sent in obj.sents])
+        print(f"{layer_id:>6} {abs_err:>12.2e} {abs_err/scale:>12.2e} {equal:>13.0%}")
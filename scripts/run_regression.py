@@ -43,6 +43,12 @@ model_name = config['model_name']
 identifier = config['identifier']
 delay_features = config['delay_features']
 audio_zeropad = config['audio_zeropad']
+# opt-in storage dtype of features (e.g. float16), None keeps extracted dtype
+feature_dtype = config.get('feature_dtype', None)
+# stream resampled features into memory-mapped (disk-backed) buffers
+memmap_features = config.get('memmap_features', False)
+# cross-validate lmbdas from per-sentence sufficient statistics
+sentence_stats = config.get('sentence_stats', False)
 
 delays_grid_search = config['delays_grid_search']
 third = config['third']
@@ -81,33 +87,46 @@ sessions = sessions[40:]
 
 
 obj = models.Regression(
-            model_name=model_name, delay_features=delay_features, audio_zeropad=audio_zeropad
+            model_name=model_name, delay_features=delay_features, audio_zeropad=audio_zeropad,
+            feature_dtype=feature_dtype, memmap_features=memmap_features,
+            sentence_stats=sentence_stats
         )
 current_time = time.time()
 elapsed_time = current_time - START
 print(f"It takes {elapsed_time:.2f} seconds to load features...!")
+# bin width of the loaded features (20ms when created), features of one bin width
+# are kept at a time
+features_bin_width = 20
 # sents = [12,13,32,43,56,163,212,218,287,308]
 for delay in delays:
-    for bin_width in bin_widths:
-        # sessions = np.array(['200206'])
-        # Session in data_dir that we do not have results for...
+    for session in sessions:
+        # bin widths that we do not have results for (for this session)...
         if file_exists:
-            sessions_done = data[
-                    (data['delay']==delay) & \
-                    (data['bin_width']==bin_width) 
-                ]['session'].unique()
-
-            subjects = sessions[np.isin(sessions,sessions_done.astype(int).astype(str), invert=True)]
+            done = data[
+                    (data['delay']==delay) & (data['session'].astype(int).astype(str)==session)
+                ]['bin_width'].unique()
+            widths = [bin_width for bin_width in bin_widths if bin_width not in done]
         else:
-            subjects = sessions
-        
-        for session in subjects:
-            print(f"Working with '{session}'")
-            # obj = get_reg_obj(data_dir, sub)
-
-            norm = obj.get_normalizer(session, bin_width=bin_width, delay=delay,
-                                       n=1 # normalizer not needed, will be updated later
-                                       )
+            widths = list(bin_widths)
+        if len(widths) == 0:
+            continue
+        print(f"Working with '{session}'")
+        if not delays_grid_search:
+            # spikes binned once for all bin widths (derived by aggregation)
+            obj.build_spike_pyramid(session, widths, delay=delay)
+
+        for bin_width in widths:
+            if bin_width != features_bin_width:
+                if audio_zeropad or memmap_features:
+                    # padding depends on bin width, memory-mapped features are streamed...
+                    obj.load_features(bin_width, delay_features=delay_features, audio_zeropad=audio_zeropad)
+                else:
+                    feature_set = obj.resample_to([bin_width], delay_features=delay_features)[bin_width]
+                    obj.use_resampled(bin_width, feature_set, delay_features=delay_features)
+                    del feature_set
+                features_bin_width = bin_width
+            # cached on disk, (computed once per session, bin_width and delay)
+            norm = obj.get_normalizer(session, bin_width=bin_width, delay=delay)
             for N_sents in dataset_sizes:
                 if delays_grid_search:
                     # delays_grid = [-30,-25,-20,-15,-10,-5,0,5,10,15,20,25,30]
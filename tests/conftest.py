@@ -0,0 +1,60 @@
+import os
+import numpy as np
+import pytest
+from scipy import io
+
+import auditory_cortex.dataset as dataset
+
+SESSION = '180810'
+NUM_SENTS = 20
+NUM_CHANNELS = 4
+FS = 16000
+
+
+def write_dataset(root, seed=0):
+    """Writes a small synthetic dataset (stimulus file and one session of 
+    __MUspk.mat files) with the layout of the recordings."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.join(root, SESSION), exist_ok=True)
+    durations = rng.uniform(1.5, 3.0, NUM_SENTS).round(4)
+    records = np.zeros((NUM_SENTS,), dtype=[
+        ('soundf', 'O'), ('sound', 'O'), ('duration', 'O'), ('phnmat', 'O'), ('befaft', 'O')
+    ])
+    for i, duration in enumerate(durations):
+        records[i]['soundf'] = FS
+        records[i]['sound'] = 0.1*rng.standard_normal(int(duration*FS))
+        records[i]['duration'] = duration
+        phnmat = np.zeros((10, int(duration*100)))
+        phnmat[rng.integers(0, 10, phnmat.shape[1]), np.arange(phnmat.shape[1])] = 1
+        records[i]['phnmat'] = phnmat
+        records[i]['befaft'] = np.array([0.5, 0.5])
+    io.savemat(os.path.join(root, dataset.STIMULUS_MAT_FILE), {
+        'sentdet': records, 'features': np.zeros((2, 2)),
+        'phnnames': np.array([f'ph{k}' for k in range(10)], dtype=object),
+    })
+    # every sentence once, first 3 sentences repeated...
+    codes = rng.permutation(list(range(1, NUM_SENTS + 1)) + [1, 2, 3]*4)
+    for ch in range(NUM_CHANNELS):
+        trial, stimlock = [], []
+        for tr, code in enumerate(codes):
+            d = durations[code - 1] - 1.0
+            # ms-quantized spike times (many of them fall on bin edges)
+            times = np.sort(np.round(rng.uniform(-0.2, d + 0.3, rng.poisson(60*d)), 3))
+            trial.append(np.full(times.size, tr + 1))
+            stimlock.append(times)
+        trial, stimlock = np.concatenate(trial), np.concatenate(stimlock)
+        io.savemat(os.path.join(root, SESSION, f'ch{ch:02d}_MUspk.mat'), {
+            'spike': {
+                'trial': trial.astype(np.uint16), 'stimlock': stimlock, 'spktimes': stimlock + trial,
+                'timitStimcode': codes[trial - 1].astype(np.uint16),
+            },
+            'trial': {'timitStimcode': codes.astype(np.uint16), 'stimon': np.arange(codes.size, dtype=float)},
+        })
+    return root
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Directory with a synthetic dataset, caches are written under tmp_path."""
+    monkeypatch.setattr(dataset, 'cache_dir', str(tmp_path / 'cache'))
+    return write_dataset(str(tmp_path / 'data'))
@@ -0,0 +1,95 @@
+import os
+import multiprocessing
+import numpy as np
+
+import auditory_cortex.dataset as dataset
+from auditory_cortex.dataset import NeuralData, StimulusBank, compile_session, load_normalizer, COMPILED_DIR
+from conftest import SESSION
+
+
+def test_concurrent_compiles_publish_readable_store(data_dir):
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(2) as pool:
+        out_dirs = pool.starmap(compile_session, [(data_dir, SESSION)]*4)
+    assert len(set(out_dirs)) == 1
+    # no temporary or stale directories left behind...
+    assert [name for name in os.listdir(os.path.join(data_dir, SESSION)) if COMPILED_DIR in name] == [COMPILED_DIR]
+
+    data = NeuralData(data_dir, SESSION)
+    assert data.compiled_layout() is not None
+    spikes = data.retrieve_spike_times(sent=5)
+    # recompiling keeps the store (and arrays already memory-mapped) valid
+    compile_session(data_dir, SESSION)
+    assert all(np.array_equal(spikes[ch], data.retrieve_spike_times(sent=5)[ch]) for ch in spikes)
+    assert NeuralData(data_dir, SESSION).compiled_layout() is not None
+
+
+def test_get_trials_matches_stimcode_scan(data_dir):
+    data = NeuralData(data_dir, SESSION)
+    stimcodes = np.asarray(data.trials[0].timitStimcode)
+    for sent in [0, 1, 2, 5, 20, 21, 499, -1]:
+        trials = data.get_trials(sent)
+        assert np.array_equal(trials, np.where(stimcodes == sent)[0] + 1)
+    assert len(data.get_trials(499)) == 0
+
+
+def test_spike_pyramid_matches_direct_binning(data_dir):
+    data = NeuralData(data_dir, SESSION)
+    sents = np.arange(1, 21)
+    bin_widths = [5, 10, 20, 25, 40, 50, 100]
+    for delay in [0, 10, 35]:
+        direct = {}
+        for bin_width in bin_widths:
+            data.extract_spikes(bin_width, delay, sents=sents)
+            direct[bin_width] = (data.raw_spikes, dict(data.sent_sections))
+        data.build_spike_pyramid(bin_widths, delay=delay, sents=sents)
+        for bin_width in bin_widths:
+            assert data.pyramid_covers(bin_width, delay, list(sents))
+            data.extract_spikes(bin_width, delay, sents=sents)
+            spikes, sections = direct[bin_width]
+            assert data.sent_sections == sections
+            for sent in sents:
+                assert np.array_equal(data.raw_spikes[sent], spikes[sent]), (bin_width, delay, sent)
+
+
+def test_concurrent_stimulus_bank_compiles_keep_valid_cache(data_dir):
+    first = StimulusBank(data_dir)
+    audio = first.audio(3)
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(2) as pool:
+        durations = pool.map(bank_durations, [data_dir]*4)
+    assert all(d == durations[0] for d in durations)
+    # compiling again never removes the cache memory-mapped by 'first'
+    StimulusBank(data_dir).compile()
+    assert np.array_equal(first.audio(3), audio)
+    assert os.listdir(os.path.dirname(first.cache_path)) == [os.path.basename(first.cache_path)]
+
+
+def test_stimulus_bank_audio_matches_mat_file(data_dir):
+    sentdet = StimulusBank(data_dir).sentdet
+    for bank in [StimulusBank(data_dir), StimulusBank(data_dir)]:
+        for sent in [1, 7, 20]:
+            det = sentdet[sent - 1]
+            sound = det.sound[int(0.5*det.soundf):-int(0.5*det.soundf)]
+            assert bank.audio(sent).dtype == sound.dtype
+            assert np.array_equal(bank.audio(sent), sound)
+
+
+def bank_durations(data_dir):
+    """Compiles the stimulus bank of 'data_dir' (in a worker process)."""
+    import auditory_cortex.dataset as dataset
+    dataset.cache_dir = os.path.join(os.path.dirname(data_dir), 'cache')
+    bank = StimulusBank(data_dir)
+    bank.compile()
+    return [bank.duration(sent) for sent in range(1, 21)]
+
+
+def test_normalizer_returned_when_cache_unwritable(data_dir, tmp_path, monkeypatch):
+    data = NeuralData(data_dir, SESSION)
+    # cache_dir under a regular file, cache can not be written...
+    blocker = tmp_path / 'blocker'
+    blocker.write_text('')
+    monkeypatch.setattr(dataset, 'cache_dir', str(blocker / 'cache'))
+    normalizer = data.get_normalizer(sents=[1, 2, 3], n=20)
+    assert normalizer.shape == (data.num_channels,)
+    assert load_normalizer(data_dir, SESSION, [1, 2, 3], n=20) is None
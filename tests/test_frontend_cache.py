@@ -0,0 +1,36 @@
+import os
+import numpy as np
+
+import auditory_cortex.frontend_cache as frontend_cache
+from auditory_cortex.frontend_cache import FrontEndCache
+
+
+def spectrogram(waveform):
+    return np.outer(waveform, np.arange(8, dtype=np.float32))
+
+
+def test_memory_bounded_by_bytes(tmp_path, monkeypatch):
+    monkeypatch.setattr(frontend_cache, 'cache_dir', str(tmp_path))
+    waveforms = [np.random.default_rng(i).standard_normal(100).astype(np.float32) for i in range(10)]
+    item_bytes = spectrogram(waveforms[0]).nbytes
+    cache = FrontEndCache('test', {'n': 8}, max_bytes=3*item_bytes)
+    for waveform in waveforms:
+        assert np.array_equal(cache.get(waveform, spectrogram), spectrogram(waveform))
+    assert len(cache.memory) == 3 and cache.memory_bytes == 3*item_bytes
+    # outputs dropped from memory are read from disk
+    assert np.array_equal(cache.get(waveforms[0], None), spectrogram(waveforms[0]))
+    assert sorted(os.listdir(cache.path)) == sorted(
+        ['meta.json'] + [f'{frontend_cache.waveform_digest(w)}.npy' for w in waveforms]
+    )
+
+
+def test_outputs_computed_when_cache_unwritable(tmp_path, monkeypatch):
+    # cache_dir under a regular file, cache can not be written...
+    blocker = tmp_path / 'blocker'
+    blocker.write_text('')
+    monkeypatch.setattr(frontend_cache, 'cache_dir', str(blocker / 'cache'))
+    cache = FrontEndCache('test', {'n': 8})
+    assert not cache.writable
+    waveform = np.ones(50, dtype=np.float32)
+    assert np.array_equal(cache.get(waveform, spectrogram), spectrogram(waveform))
+    assert np.array_equal(cache.get(waveform, None), spectrogram(waveform))
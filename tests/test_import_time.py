@@ -0,0 +1,57 @@
+import sys
+import json
+import subprocess
+
+import pytest
+
+# Import-time budget: each module is imported in a fresh interpreter, the best
+# of a few runs is compared against its budget (seconds, generous to allow for
+# loaded machines), heavy packages that must stay deferred (imported only on
+# first use) must be absent from sys.modules after the import.
+
+REPEATS = 3
+
+# module: (budget in seconds, packages that must not be imported)
+BUDGETS = {
+    'auditory_cortex': (1.5, ['torch', 'matplotlib', 'pandas', 'pycolormap_2d']),
+    'auditory_cortex.utils': (3.0, ['torch', 'torchaudio', 'matplotlib', 'pandas', 'pycolormap_2d']),
+    'auditory_cortex.dataset': (4.5, ['torch', 'torchaudio', 'matplotlib', 'pandas']),
+    'auditory_cortex.analysis': (6.0, [
+        'torch', 'torchaudio', 'transformers', 'wav2letter', 'sklearn',
+        'matplotlib', 'seaborn', 'plotly', 'pycolormap_2d',
+    ]),
+    'auditory_cortex.models': (15.0, [
+        'transformers', 'wav2letter', 'fairseq', 'deepspeech_pytorch', 'torchaudio',
+        'sklearn', 'pandas', 'matplotlib', 'seaborn', 'plotly', 'pycolormap_2d',
+    ]),
+}
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'elapsed': elapsed, 'loaded': [m for m in {deferred} if m in sys.modules]}}))
+"""
+
+
+def measure(module, deferred):
+    """Returns (best import time, deferred packages found loaded) for 'module'."""
+    best, loaded = float('inf'), []
+    for _ in range(REPEATS):
+        out = subprocess.run(
+            [sys.executable, '-c', PROBE.format(module=module, deferred=deferred)],
+            capture_output=True, text=True, check=True
+            )
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        best = min(best, result['elapsed'])
+        loaded = result['loaded']
+    return best, loaded
+
+
+@pytest.mark.parametrize('module', list(BUDGETS))
+def test_import_time_within_budget(module):
+    budget, deferred = BUDGETS[module]
+    elapsed, loaded = measure(module, deferred)
+    assert not loaded, f"'{module}' imported deferred packages: {loaded}"
+    assert elapsed <= budget, f"'{module}' took {elapsed:.3f}s, budget is {budget:.1f}s."
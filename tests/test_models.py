@@ -0,0 +1,37 @@
+import numpy as np
+
+from auditory_cortex.dataset import NeuralData
+from auditory_cortex.models import Regression
+from conftest import SESSION, NUM_SENTS, NUM_CHANNELS
+
+
+def spikes_regression(data_dir):
+    """Regression object set up for spikes only (no network or features)."""
+    obj = object.__new__(Regression)
+    obj.data_dir = data_dir
+    obj.spike_datasets = {}
+    obj.features_delay_trim = None
+    obj._neural_data = None
+    obj._switch_session(SESSION)
+    obj.get_dataset_object(SESSION).sents = np.arange(1, NUM_SENTS + 1)
+    return obj
+
+
+def test_loaded_session_rebinned_at_widths_not_in_pyramid(data_dir):
+    obj = spikes_regression(data_dir)
+    obj.build_spike_pyramid(SESSION, [20, 40], delay=10)
+    reference = NeuralData(data_dir, SESSION)
+    reference.sents = np.arange(1, NUM_SENTS + 1)
+    # covered and not covered widths (and delays) alternately...
+    for bin_width, delay in [(20, 10), (50, 10), (40, 10), (40, 0), (20, 10), (30, 10)]:
+        obj.load_spikes(SESSION, bin_width=bin_width, delay=delay)
+        spikes = obj.get_neural_spikes(SESSION, bin_width=bin_width, delay=delay, numpy=True)
+        reference.extract_spikes(bin_width, delay)
+        assert np.array_equal(spikes, reference.unroll_spikes()), (bin_width, delay)
+
+
+def test_single_session_methods_use_neural_data(data_dir):
+    obj = spikes_regression(data_dir)
+    assert obj.neural_data is obj.neural_data
+    assert obj.neural_data.num_channels == NUM_CHANNELS
+    assert obj.neural_data.signal_power(20, sents=[1, 2, 3]).shape == (NUM_CHANNELS,)
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+from scipy import signal
+
+from auditory_cortex.resampling import Resampler
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_resampler_bitwise_equal_to_signal_resample(dtype):
+    rng = np.random.default_rng(0)
+    resampler = Resampler()
+    for N, num in [(149, 100), (37, 50), (600, 301), (1, 3)]:
+        # layers of equal (resampled together) and different lengths
+        features = [rng.standard_normal((n, d)).astype(dtype) for n, d in [(N, 8), (N, 5), (N + 2, 3)]]
+        for feats, resampled in zip(features, resampler.resample(features, num)):
+            expected = signal.resample(feats, num, axis=0)
+            assert resampled.dtype == expected.dtype
+            assert np.array_equal(resampled, expected)
+    assert resampler.misses == 0
+
+
+def test_operator_path_within_tolerance():
+    rng = np.random.default_rng(0)
+    resampler = Resampler(max_operator_len=512)
+    features = [rng.standard_normal((149, 8)).astype(np.float32)]
+    resampled = resampler.resample(features, 100)[0]
+    expected = signal.resample(features[0], 100, axis=0)
+    assert resampler.misses == 1
+    assert np.max(np.abs(resampled - expected)) < 1e-5